@@ -1,117 +1,359 @@
 from __future__ import annotations
+import asyncio
+import json
+import logging
+import time
 from typing import AsyncGenerator
+from openai import AsyncOpenAI
 from agent.events import AgentEvent, AgentEventType
+from agent.loop_detector import LoopDetector
 from agent.session import Session
+from agent.stats import RunStats
 from client.response import StreamEventType, ToolCall, ToolResultMessage
 from config.config import Config
+from prompts.system import create_loop_breaker_prompt
+from tools.base import ToolResult
+
+logger = logging.getLogger(__name__)
 
 
 class Agent:
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, client: AsyncOpenAI | None = None):
         self.config = config
-        self.session: Session | None = Session(self.config)
+        self.session: Session | None = Session(self.config, client=client)
+        self._run_stats: RunStats | None = None
+        self._tool_semaphore = asyncio.Semaphore(self.config.max_tool_concurrency)
+        self._loop_detector = self._create_loop_detector()
+        self._loop_interventions = 0
+
+    def _create_loop_detector(self) -> LoopDetector:
+        loop_config = self.config.loop_detection
+        return LoopDetector(
+            window=loop_config.window,
+            max_repeats=loop_config.max_repeats,
+            max_cycle_length=loop_config.max_cycle_length,
+        )
 
     async def run(self, message: str):
         yield AgentEvent.agent_start(message)
         self.session.context_manager.add_user_message(message)
+        self._run_stats = stats = RunStats(model=self.config.model)
+        self._loop_detector.reset()
+        self._loop_interventions = 0
 
         final_response: str | None = None
-        async for event in self._agentic_loop(message):
-            yield event
+        try:
+            async for event in self._agentic_loop(message):
+                yield event
 
-            if event.type == AgentEventType.TEXT_COMPLETE:
-                final_response = event.data.get("content")
+                if event.type == AgentEventType.TEXT_COMPLETE:
+                    final_response = event.data.get("content")
+        finally:
+            # Interrupted runs still count towards the session totals
+            stats.finish()
+            if self.session:
+                self.session.record_run(stats)
 
-        yield AgentEvent.agent_end(final_response)
+        yield AgentEvent.agent_end(final_response, stats)
 
     async def _agentic_loop(
         self, user_message: str
     ) -> AsyncGenerator[AgentEvent, None]:
         max_turns = self.config.max_turns
         for turn_num in range(max_turns):
-            self.session.increment_turn()
+            turn_stats = self._run_stats.start_turn(self.session.increment_turn())
             response_text = ""
+
+            self.session.context_manager.evict_stale_tool_outputs()
+            if self.session.context_manager.needs_compaction():
+                error = await self._compact_context()
+                if error is not None:
+                    yield AgentEvent.agent_error(f"Context compaction failed: {error}")
             
             tool_schemas = self.session.tool_registry.get_schemas()
             
             tool_calls: list[ToolCall] = []
 
-            async for event in self.session.client.chat_completion(
-                self.session.context_manager.get_messages(),
-                tools=tool_schemas if tool_schemas else None,
-            ):
-                if event.type == StreamEventType.TEXT_DELTA and event.text_delta:
-                    if event.text_delta:
-                        content = event.text_delta.content
-                    response_text += content
-                    yield AgentEvent.text_delta(content)
-                elif event.type == StreamEventType.TOOL_CALL_COMPLETE:
-                    if event.tool_call:
-                        tool_calls.append(event.tool_call)
+            started: dict[int, asyncio.Task[ToolResult]] = {}
+            try:
+                # Only time spent waiting on the stream counts as model time,
+                # not time the consumer spends handling the yielded events
+                mark = time.perf_counter()
+                async for event in self.session.client.chat_completion(
+                    self.session.context_manager.get_messages(),
+                    tools=tool_schemas if tool_schemas else None,
+                    prompt_tokens=self.session.context_manager.get_token_count(),
+                ):
+                    turn_stats.model_time += time.perf_counter() - mark
+                    if turn_stats.time_to_first_token is None and event.type in (
+                        StreamEventType.TEXT_DELTA,
+                        StreamEventType.TOOL_CALL_START,
+                        StreamEventType.TOOL_CALL_COMPLETE,
+                    ):
+                        turn_stats.time_to_first_token = turn_stats.model_time
 
-                elif event.type == StreamEventType.ERROR:
-                    yield AgentEvent.agent_error(
-                        event.error or "Unknown error occurred"
-                    )
+                    if event.type == StreamEventType.TEXT_DELTA and event.text_delta:
+                        if event.text_delta:
+                            content = event.text_delta.content
+                        response_text += content
+                        yield AgentEvent.text_delta(content)
+                    elif event.type == StreamEventType.TOOL_CALL_COMPLETE:
+                        if event.tool_call:
+                            tool_calls.append(event.tool_call)
+                            # Start read-only calls while the model is still
+                            # streaming, unless a mutating call precedes them
+                            call_idx = len(tool_calls) - 1
+                            if len(started) == call_idx and self._is_read_only(
+                                event.tool_call
+                            ):
+                                started[call_idx] = asyncio.create_task(
+                                    self._invoke_tool(event.tool_call)
+                                )
+                                yield AgentEvent.tool_call_start(
+                                    event.tool_call.call_id,
+                                    event.tool_call.name,
+                                    event.tool_call.arguments,
+                                )
 
-            self.session.context_manager.add_assistant_message(
-                response_text or None,
-                (
-                    [
-                        {
-                            "id": tc.call_id,
-                            "type": "function",
-                            "function": {
-                                "name": tc.name,
-                                "arguments": str(tc.arguments),
-                            },
-                        }
-                        for tc in tool_calls
-                    ]
-                    if tool_calls
-                    else None
-                ),
-            )
-            if response_text:
-                yield AgentEvent.text_complete(response_text)
+                    elif event.type == StreamEventType.STREAM_RESET:
+                        # The response is being regenerated after a dropped
+                        # connection; drop everything streamed so far
+                        response_text = ""
+                        tool_calls.clear()
+                        for task in started.values():
+                            task.cancel()
+                        started.clear()
+                        yield AgentEvent.stream_reset()
 
-            if not tool_calls:
-                return
+                    elif event.type == StreamEventType.MESSAGE_COMPLETE:
+                        if event.usage:
+                            turn_stats.usage = event.usage
+                        if event.queue_time:
+                            # Waiting on the rate limiter happened before the
+                            # request was sent, so it isn't model time
+                            turn_stats.queue_time = event.queue_time
+                            turn_stats.model_time -= event.queue_time
+                            if turn_stats.time_to_first_token is not None:
+                                turn_stats.time_to_first_token -= event.queue_time
 
-            tool_call_results: list[ToolResultMessage] = []
+                    elif event.type == StreamEventType.ERROR:
+                        yield AgentEvent.agent_error(
+                            event.error or "Unknown error occurred"
+                        )
 
-            for tool_call in tool_calls:
-                yield AgentEvent.tool_call_start(
-                    tool_call.call_id,
-                    tool_call.name,
-                    tool_call.arguments,
+                    mark = time.perf_counter()
+                turn_stats.model_time += time.perf_counter() - mark
+
+                self.session.context_manager.add_assistant_message(
+                    response_text or None,
+                    (
+                        [
+                            {
+                                "id": tc.call_id,
+                                "type": "function",
+                                "function": {
+                                    "name": tc.name,
+                                    # Serialized deterministically so the
+                                    # history prefix stays byte-stable for
+                                    # provider prompt caching
+                                    "arguments": json.dumps(tc.arguments),
+                                },
+                            }
+                            for tc in tool_calls
+                        ]
+                        if tool_calls
+                        else None
+                    ),
                 )
+                if response_text:
+                    yield AgentEvent.text_complete(response_text)
 
-                result = await self.session.tool_registry.invoke(
-                    tool_call.name,
-                    tool_call.arguments,
-                    self.config.cwd,
+                if not tool_calls:
+                    return
+
+                turn_stats.tool_calls = len(tool_calls)
+                results: dict[int, ToolResult] = {}
+                try:
+                    mark = time.perf_counter()
+                    async for event in self._execute_tool_calls(
+                        tool_calls, results, started
+                    ):
+                        turn_stats.tool_time += time.perf_counter() - mark
+                        yield event
+                        mark = time.perf_counter()
+                    turn_stats.tool_time += time.perf_counter() - mark
+                except (asyncio.CancelledError, GeneratorExit):
+                    # The assistant message is already in the context, so every
+                    # tool call needs a result for the next request to be valid
+                    self._add_tool_results(tool_calls, results)
+                    raise
+
+                tool_call_results = self._add_tool_results(tool_calls, results)
+
+                if self.config.loop_detection.enabled:
+                    loop_description = self._detect_loop(tool_calls, tool_call_results)
+                    if loop_description:
+                        if (
+                            self._loop_interventions
+                            >= self.config.loop_detection.max_interventions
+                        ):
+                            yield AgentEvent.agent_error(
+                                "Stopped: the agent is stuck in a loop",
+                                details={"loop": loop_description},
+                            )
+                            return
+
+                        self._loop_interventions += 1
+                        self.session.context_manager.add_user_message(
+                            create_loop_breaker_prompt(loop_description)
+                        )
+            finally:
+                for task in started.values():
+                    task.cancel()
+
+    def _add_tool_results(
+        self,
+        tool_calls: list[ToolCall],
+        results: dict[int, ToolResult],
+    ) -> list[ToolResultMessage]:
+        tool_call_results: list[ToolResultMessage] = []
+        for idx, tool_call in enumerate(tool_calls):
+            result = results.get(idx) or ToolResult.error_result(
+                "Cancelled before completion"
+            )
+            tool_call_results.append(
+                ToolResultMessage(
+                    tool_call_id=tool_call.call_id,
+                    content=result.to_model_output(),
+                    is_error=not result.success,
+                    tool_name=tool_call.name,
+                    metadata=result.metadata,
+                    is_mutating=not self._is_read_only(tool_call),
                 )
+            )
+
+        self.session.context_manager.add_tool_results(tool_call_results)
+        return tool_call_results
+
+    def _detect_loop(
+        self,
+        tool_calls: list[ToolCall],
+        tool_call_results: list[ToolResultMessage],
+    ) -> str | None:
+        for tool_call, tool_result in zip(tool_calls, tool_call_results):
+            self._loop_detector.record(tool_call, tool_result.content)
+
+        loop_description = self._loop_detector.check()
+        if loop_description:
+            # Start over so the same history doesn't trigger again next turn
+            self._loop_detector.reset()
+        return loop_description
+
+    def _is_read_only(self, tool_call: ToolCall) -> bool:
+        tool = self.session.tool_registry.get(tool_call.name)
+        return tool is not None and not tool.is_mutating(tool_call.arguments)
+
+    async def _invoke_tool(self, tool_call: ToolCall) -> ToolResult:
+        tool = self.session.tool_registry.get(tool_call.name)
+        timeout = self.config.tools.get_timeout(
+            tool_call.name or "",
+            tool.timeout if tool else None,
+        )
+        async with self._tool_semaphore:
+            return await self.session.tool_registry.invoke(
+                tool_call.name,
+                tool_call.arguments,
+                self.config.cwd,
+                timeout=timeout,
+            )
+
+    async def _execute_tool_calls(
+        self,
+        tool_calls: list[ToolCall],
+        results: dict[int, ToolResult],
+        started: dict[int, asyncio.Task[ToolResult]] | None = None,
+    ) -> AsyncGenerator[AgentEvent, None]:
+        started = started or {}
+        # Consecutive read-only calls run concurrently; a mutating call runs
+        # alone, so writes keep their order relative to everything else
+        idx = 0
+        while idx < len(tool_calls):
+            group = [idx]
+            idx += 1
+            if self._is_read_only(tool_calls[group[0]]):
+                while idx < len(tool_calls) and self._is_read_only(tool_calls[idx]):
+                    group.append(idx)
+                    idx += 1
+
+            tasks: dict[asyncio.Task[ToolResult], int] = {}
+            for call_idx in group:
+                if call_idx in started:
+                    tasks[started[call_idx]] = call_idx
+                    continue
 
-                yield AgentEvent.tool_call_complete(
+                tool_call = tool_calls[call_idx]
+                yield AgentEvent.tool_call_start(
                     tool_call.call_id,
                     tool_call.name,
-                    result,
+                    tool_call.arguments,
                 )
+                tasks[asyncio.create_task(self._invoke_tool(tool_call))] = call_idx
 
-                tool_call_results.append(
-                    ToolResultMessage(
-                        tool_call_id=tool_call.call_id,
-                        content=result.to_model_output(),
-                        is_error=not result.success,
+            pending = set(tasks)
+            try:
+                while pending:
+                    done, pending = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED
                     )
-                )
+                    for task in sorted(done, key=tasks.__getitem__):
+                        call_idx = tasks[task]
+                        tool_call = tool_calls[call_idx]
+                        results[call_idx] = task.result()
+                        yield AgentEvent.tool_call_complete(
+                            tool_call.call_id,
+                            tool_call.name,
+                            results[call_idx],
+                        )
+            finally:
+                for task in pending:
+                    task.cancel()
 
-            for tool_result in tool_call_results:
-                self.session.context_manager.add_tool_result(
-                    tool_result.tool_call_id,
-                    tool_result.content,
-                )
+    async def _compact_context(self) -> str | None:
+        context_manager = self.session.context_manager
+        split = context_manager.get_compaction_split()
+        if split is None:
+            # Too few turns to summarize; not an error, but don't keep trying
+            logger.warning("Context needs compaction but has no turns to summarize")
+            context_manager.record_compaction_failure()
+            return None
+
+        summary = ""
+        error: str | None = None
+        started_at = time.perf_counter()
+        try:
+            async for event in self.session.client.chat_completion(
+                context_manager.get_compaction_messages(split),
+            ):
+                if event.type == StreamEventType.TEXT_DELTA and event.text_delta:
+                    summary += event.text_delta.content
+                elif event.type == StreamEventType.STREAM_RESET:
+                    summary = ""
+                elif event.type == StreamEventType.MESSAGE_COMPLETE and event.usage:
+                    self._run_stats.compaction_usage += event.usage
+                elif event.type == StreamEventType.ERROR:
+                    error = event.error or "Unknown error occurred"
+                    break
+        finally:
+            self._run_stats.compaction_time += time.perf_counter() - started_at
+
+        if error is None and not summary:
+            error = "empty summary"
+        if error is not None:
+            context_manager.record_compaction_failure()
+            return error
+
+        context_manager.apply_compaction(summary, split)
+        return None
 
     async def __aenter__(self) -> Agent:
         return self
@@ -124,4 +366,5 @@ class Agent:
     ) -> None:
         if self.session and self.session.client:
             await self.session.client.close()
+            self.session.context_manager.close()
             self.session = None
@@ -0,0 +1,160 @@
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, TextIO
+
+from openai import AsyncOpenAI
+
+from agent.agent import Agent
+from agent.events import AgentEventType
+from client.llm_client import create_openai_client
+from config.config import Config
+from config.loader import load_config_for_cwd
+from utils.errors import ConfigError
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchTask:
+    task_id: str
+    prompt: str
+    cwd: Path | None = None
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any], line_number: int) -> BatchTask:
+        prompt = data.get("prompt")
+        if not isinstance(prompt, str) or not prompt.strip():
+            raise ValueError("missing 'prompt'")
+
+        cwd = data.get("cwd")
+        return cls(
+            task_id=str(data.get("id", line_number)),
+            prompt=prompt,
+            cwd=Path(cwd) if cwd else None,
+        )
+
+
+@dataclass
+class BatchResult:
+    task_id: str
+    success: bool
+    response: str | None = None
+    errors: list[str] = field(default_factory=list)
+    stats: dict[str, Any] | None = None
+    elapsed: float = 0.0
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "id": self.task_id,
+            "success": self.success,
+            "response": self.response,
+            "errors": self.errors,
+            "stats": self.stats,
+            "elapsed": self.elapsed,
+        }
+
+
+def load_batch_tasks(path: Path) -> list[BatchTask]:
+    tasks: list[BatchTask] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+                if not isinstance(data, dict):
+                    raise ValueError("expected a JSON object")
+                tasks.append(BatchTask.from_dict(data, line_number))
+            except ValueError as e:
+                raise ConfigError(
+                    f"Invalid task on line {line_number}: {e}",
+                    config_file=str(path),
+                ) from e
+    return tasks
+
+
+class BatchRunner:
+    def __init__(
+        self,
+        config: Config,
+        concurrency: int = 4,
+        client: AsyncOpenAI | None = None,
+    ) -> None:
+        self.config = config
+        self.concurrency = max(1, concurrency)
+        self._client = client
+
+    async def run(self, tasks: list[BatchTask], output: TextIO) -> list[BatchResult]:
+        queue: asyncio.Queue[BatchTask] = asyncio.Queue()
+        for task in tasks:
+            queue.put_nowait(task)
+
+        # One client for every agent, so all tasks share a connection pool
+        owns_client = self._client is None
+        client = self._client or create_openai_client(self.config)
+        results: list[BatchResult] = []
+
+        async def worker() -> None:
+            while True:
+                try:
+                    task = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+
+                result = await self._run_task(task, client)
+                results.append(result)
+                # Results are written as tasks finish, not in input order
+                output.write(json.dumps(result.to_dict(), default=str) + "\n")
+                output.flush()
+
+        try:
+            await asyncio.gather(
+                *(worker() for _ in range(min(self.concurrency, len(tasks))))
+            )
+        finally:
+            if owns_client:
+                await client.close()
+
+        return results
+
+    def _get_task_config(self, task: BatchTask) -> Config:
+        if task.cwd is None:
+            return self.config
+
+        cwd = task.cwd
+        if not cwd.is_absolute():
+            cwd = self.config.cwd / cwd
+        return load_config_for_cwd(self.config, cwd.resolve())
+
+    async def _run_task(self, task: BatchTask, client: AsyncOpenAI) -> BatchResult:
+        started_at = time.perf_counter()
+        result = BatchResult(task_id=task.task_id, success=False)
+
+        try:
+            config = self._get_task_config(task)
+            errors = config.validate()
+            if errors:
+                result.errors.extend(errors)
+                return result
+
+            async with Agent(config, client=client) as agent:
+                async for event in agent.run(task.prompt):
+                    if event.type == AgentEventType.AGENT_ERROR:
+                        result.errors.append(event.data.get("error", "Unknown error"))
+                    elif event.type == AgentEventType.AGENT_END:
+                        result.response = event.data.get("response")
+                        result.stats = event.data.get("stats")
+
+            result.success = not result.errors and result.response is not None
+        except Exception as e:
+            logger.exception(f"Batch task {task.task_id} failed")
+            result.errors.append(str(e))
+        finally:
+            result.elapsed = time.perf_counter() - started_at
+
+        return result
@@ -3,7 +3,7 @@ from enum import Enum
 from dataclasses import dataclass, field
 from typing import Any
 
-from client.response import TokenUsage
+from agent.stats import RunStats
 from tools.base import ToolResult
 
 class AgentEventType(str, Enum):
@@ -19,6 +19,8 @@ class AgentEventType(str, Enum):
     # Text streaming
     TEXT_DELTA = "text_delta"
     TEXT_COMPLETE = "text_complete"
+    # Text and tool calls streamed so far in this turn were discarded
+    STREAM_RESET = "stream_reset"
 
 
 @dataclass
@@ -26,15 +28,33 @@ class AgentEvent:
     type: AgentEventType
     data: dict[str, Any] = field(default_factory=dict)
 
+    def to_dict(self) -> dict[str, Any]:
+        return {"type": self.type.value, "data": self.data}
+
     @classmethod
     def agent_start(cls, message: str) -> AgentEvent:
         return cls(type=AgentEventType.AGENT_START, data={"message": message})
 
     @classmethod
-    def agent_end(cls, response: str, usage: TokenUsage | None = None) -> AgentEvent:
+    def agent_end(
+        cls,
+        response: str,
+        stats: RunStats | None = None,
+    ) -> AgentEvent:
+        usage = stats.usage if stats else None
         return cls(
             type=AgentEventType.AGENT_END,
-            data={"response": response, "usage": usage.__dict__ if usage else None},
+            data={
+                "response": response,
+                "usage": usage.__dict__ if usage else None,
+                "cache_hit_ratio": usage.cache_hit_ratio if usage else None,
+                "turn_cache_hit_ratios": [
+                    turn.usage.cache_hit_ratio if turn.usage else None
+                    for turn in (stats.turns if stats else [])
+                ],
+                "cost": stats.cost if stats else None,
+                "stats": stats.to_dict() if stats else None,
+            },
         )
 
     @classmethod
@@ -50,6 +70,10 @@ class AgentEvent:
     def text_delta(cls, content: str) -> AgentEvent:
         return cls(type=AgentEventType.TEXT_DELTA, data={"content": content})
     
+    @classmethod
+    def stream_reset(cls) -> AgentEvent:
+        return cls(type=AgentEventType.STREAM_RESET)
+
     @classmethod
     def text_complete(cls, content: str) -> AgentEvent:
         return cls(type=AgentEventType.TEXT_COMPLETE, data={"content": content})
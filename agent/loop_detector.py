@@ -0,0 +1,76 @@
+from __future__ import annotations
+import json
+from collections import deque
+from dataclasses import dataclass
+
+from client.response import ToolCall
+from utils.text import content_digest
+
+
+@dataclass(frozen=True)
+class _CallFingerprint:
+    name: str
+    digest: bytes
+
+    @classmethod
+    def create(cls, tool_call: ToolCall, result: str) -> _CallFingerprint:
+        arguments = json.dumps(tool_call.arguments, sort_keys=True, default=str)
+        return cls(
+            name=tool_call.name or "unknown",
+            digest=content_digest(f"{tool_call.name}\0{arguments}\0{result}"),
+        )
+
+
+class LoopDetector:
+    def __init__(
+        self,
+        window: int = 20,
+        max_repeats: int = 3,
+        max_cycle_length: int = 3,
+    ) -> None:
+        self.max_repeats = max_repeats
+        self.max_cycle_length = max_cycle_length
+        self._history: deque[_CallFingerprint] = deque(maxlen=window)
+
+    def record(self, tool_call: ToolCall, result: str) -> None:
+        self._history.append(_CallFingerprint.create(tool_call, result))
+
+    def reset(self) -> None:
+        self._history.clear()
+
+    def check(self) -> str | None:
+        history = list(self._history)
+        if not history:
+            return None
+
+        # The same call with the same result, anywhere in the window
+        latest = history[-1]
+        repeats = sum(1 for fingerprint in history if fingerprint == latest)
+        if repeats >= self.max_repeats:
+            return (
+                f"`{latest.name}` was called {repeats} times with the same "
+                "arguments and got the same result each time."
+            )
+
+        # A short sequence of calls repeating back to back, e.g. A B A B. A
+        # whole repeated sequence is a stronger signal than a single call, so
+        # one repetition fewer is enough
+        cycle_repeats = max(2, self.max_repeats - 1)
+        for length in range(2, self.max_cycle_length + 1):
+            if len(history) < length * cycle_repeats:
+                break
+
+            cycle = history[-length:]
+            if len(set(cycle)) < length:
+                continue
+            if all(
+                history[-(i + 1) * length : len(history) - i * length] == cycle
+                for i in range(1, cycle_repeats)
+            ):
+                names = " -> ".join(fingerprint.name for fingerprint in cycle)
+                return (
+                    f"The sequence {names} repeated {cycle_repeats} times "
+                    "with identical arguments and results."
+                )
+
+        return None
@@ -1,14 +1,19 @@
+from __future__ import annotations
 import uuid
 from datetime import datetime
+from typing import Any
+from openai import AsyncOpenAI
+from agent.stats import RunStats
 from client.llm_client import LLMClient
 from config.config import Config
+from client.response import TokenUsage
 from context.manager import ContextManager
 from tools.registry import create_default_registry
 
 
 class Session:
-    def __init__(self, config: Config):
-        self.client = LLMClient(config=config)
+    def __init__(self, config: Config, client: AsyncOpenAI | None = None):
+        self.client = LLMClient(config=config, client=client)
         self.context_manager = ContextManager(config=config)
         self.tool_registry = create_default_registry()
         self.session_id = str(uuid.uuid4())
@@ -17,8 +22,52 @@ class Session:
         
         self._turn_count = 0
 
+        self.last_run: RunStats | None = None
+        self.run_count = 0
+        self.usage = TokenUsage()
+        self.cost: float | None = None
+        self.wall_time = 0.0
+        self.model_time = 0.0
+        self.tool_time = 0.0
+        self.queue_time = 0.0
+
     def increment_turn(self) -> int:
         self._turn_count += 1
         self.updated_at = datetime.now()
         
         return self._turn_count
+
+    def record_run(self, stats: RunStats) -> None:
+        self.last_run = stats
+        self.run_count += 1
+        self.usage += stats.usage
+        self.wall_time += stats.wall_time
+        self.model_time += stats.model_time
+        self.tool_time += stats.tool_time
+        self.queue_time += stats.queue_time
+
+        cost = stats.cost
+        if cost is not None:
+            self.cost = (self.cost or 0.0) + cost
+
+    def get_stats(self) -> dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "runs": self.run_count,
+            "turns": self._turn_count,
+            "usage": self.usage.__dict__,
+            "cache_hit_ratio": self.usage.cache_hit_ratio,
+            "cost": self.cost,
+            "wall_time": self.wall_time,
+            "model_time": self.model_time,
+            "tool_time": self.tool_time,
+            "queue_time": self.queue_time,
+            "overhead": max(
+                0.0,
+                self.wall_time - self.model_time - self.tool_time - self.queue_time,
+            ),
+            "rate_limiter": (
+                self.client.rate_limiter.stats() if self.client.rate_limiter else None
+            ),
+            "last_run": self.last_run.to_dict() if self.last_run else None,
+        }
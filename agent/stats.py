@@ -0,0 +1,104 @@
+from __future__ import annotations
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+from client.response import TokenUsage
+from config.config import ModelConfig
+
+
+@dataclass
+class TurnStats:
+    turn: int
+    usage: TokenUsage | None = None
+    # Time spent waiting on the provider, including time to first token
+    model_time: float = 0.0
+    time_to_first_token: float | None = None
+    # Time spent queued on the client-side rate limiter
+    queue_time: float = 0.0
+    # Time spent waiting on tools once the response finished streaming
+    tool_time: float = 0.0
+    tool_calls: int = 0
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "turn": self.turn,
+            "usage": self.usage.__dict__ if self.usage else None,
+            "cache_hit_ratio": self.usage.cache_hit_ratio if self.usage else None,
+            "model_time": self.model_time,
+            "time_to_first_token": self.time_to_first_token,
+            "queue_time": self.queue_time,
+            "tool_time": self.tool_time,
+            "tool_calls": self.tool_calls,
+        }
+
+
+@dataclass
+class RunStats:
+    model: ModelConfig
+    turns: list[TurnStats] = field(default_factory=list)
+    # Summarization requests made to keep the context within its window
+    compaction_usage: TokenUsage = field(default_factory=TokenUsage)
+    compaction_time: float = 0.0
+    started_at: float = field(default_factory=time.perf_counter)
+    wall_time: float = 0.0
+
+    @property
+    def usage(self) -> TokenUsage:
+        usage = self.compaction_usage
+        for turn in self.turns:
+            if turn.usage:
+                usage = usage + turn.usage
+        return usage
+
+    @property
+    def model_time(self) -> float:
+        return self.compaction_time + sum(turn.model_time for turn in self.turns)
+
+    @property
+    def tool_time(self) -> float:
+        return sum(turn.tool_time for turn in self.turns)
+
+    @property
+    def queue_time(self) -> float:
+        return sum(turn.queue_time for turn in self.turns)
+
+    @property
+    def overhead(self) -> float:
+        return max(
+            0.0,
+            self.wall_time - self.model_time - self.tool_time - self.queue_time,
+        )
+
+    @property
+    def cost(self) -> float | None:
+        usage = self.usage
+        return self.model.cost(
+            usage.prompt_tokens,
+            usage.completion_tokens,
+            usage.cached_tokens,
+        )
+
+    def start_turn(self, turn: int) -> TurnStats:
+        stats = TurnStats(turn=turn)
+        self.turns.append(stats)
+        return stats
+
+    def finish(self) -> None:
+        self.wall_time = time.perf_counter() - self.started_at
+
+    def to_dict(self) -> dict[str, Any]:
+        usage = self.usage
+        return {
+            "usage": usage.__dict__,
+            "cache_hit_ratio": usage.cache_hit_ratio,
+            "cost": self.cost,
+            "wall_time": self.wall_time,
+            "model_time": self.model_time,
+            "tool_time": self.tool_time,
+            "queue_time": self.queue_time,
+            "overhead": self.overhead,
+            "compaction_usage": self.compaction_usage.__dict__,
+            "compaction_time": self.compaction_time,
+            "turns": [turn.to_dict() for turn in self.turns],
+        }
@@ -0,0 +1,131 @@
+# Benchmarks the agent loop against the fake server in bench/server.py:
+#   python -m bench.run --tasks 50 --concurrency 10 --ttft 0.3 --drop-rate 0.05
+from __future__ import annotations
+import argparse
+import asyncio
+import io
+import json
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+from agent.batch import BatchResult, BatchRunner, BatchTask
+from bench.server import FakeOpenAIServer, add_server_arguments, options_from_args
+from client.rate_limiter import get_rate_limiter
+from config.config import Config
+
+
+def _percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def _mean(values: list[float]) -> float:
+    return statistics.fmean(values) if values else 0.0
+
+
+def summarize(results: list[BatchResult], elapsed: float) -> dict[str, Any]:
+    stats = [result.stats for result in results if result.stats]
+    turns = [turn for run in stats for turn in run["turns"]]
+    latencies = [result.elapsed for result in results]
+    ttfts = [
+        turn["time_to_first_token"]
+        for turn in turns
+        if turn["time_to_first_token"] is not None
+    ]
+
+    return {
+        "tasks": len(results),
+        "succeeded": sum(1 for result in results if result.success),
+        "elapsed": elapsed,
+        "tasks_per_second": len(results) / elapsed if elapsed else 0.0,
+        "turns": len(turns),
+        "latency_p50": _percentile(latencies, 0.5),
+        "latency_p95": _percentile(latencies, 0.95),
+        "time_to_first_token_mean": _mean(ttfts),
+        "model_time_mean": _mean([run["model_time"] for run in stats]),
+        "tool_time_mean": _mean([run["tool_time"] for run in stats]),
+        "queue_time_mean": _mean([run["queue_time"] for run in stats]),
+        "overhead_per_turn_mean": _mean(
+            [run["overhead"] / len(run["turns"]) for run in stats if run["turns"]]
+        ),
+        "completion_tokens": sum(run["usage"]["completion_tokens"] for run in stats),
+    }
+
+
+async def run_benchmark(args: argparse.Namespace) -> dict[str, Any]:
+    server: FakeOpenAIServer | None = None
+    base_url = args.base_url
+    if base_url is None:
+        server = FakeOpenAIServer(options_from_args(args))
+        await server.start()
+        base_url = server.base_url
+
+    os.environ["BASE_URL"] = base_url
+    os.environ.setdefault("API_KEY", "bench")
+
+    try:
+        with tempfile.TemporaryDirectory(prefix="ai-agent-bench-") as workdir:
+            cwd = Path(workdir)
+            (cwd / "README.md").write_text("# Benchmark workspace\n" * 20)
+
+            config = Config(cwd=cwd, max_turns=args.max_turns)
+            config.client.retry_base_delay = args.retry_base_delay
+            config.client.requests_per_minute = args.requests_per_minute
+            config.client.tokens_per_minute = args.tokens_per_minute
+            tasks = [
+                BatchTask(task_id=str(idx), prompt=args.prompt)
+                for idx in range(args.tasks)
+            ]
+
+            output = open(args.output, "w", encoding="utf-8") if args.output else io.StringIO()
+            started_at = time.perf_counter()
+            try:
+                results = await BatchRunner(config, concurrency=args.concurrency).run(
+                    tasks, output
+                )
+            finally:
+                output.close()
+            elapsed = time.perf_counter() - started_at
+            rate_limiter = get_rate_limiter(config)
+    finally:
+        if server is not None:
+            await server.close()
+
+    summary = summarize(results, elapsed)
+    if rate_limiter is not None:
+        summary["rate_limiter"] = rate_limiter.stats()
+    if server is not None:
+        summary["server"] = server.stats.to_dict()
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the agent loop")
+    parser.add_argument("--tasks", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--prompt", default="Read the README and summarize it.")
+    parser.add_argument("--max-turns", type=int, default=10)
+    parser.add_argument("--retry-base-delay", type=float, default=0.1)
+    parser.add_argument("--requests-per-minute", type=int)
+    parser.add_argument("--tokens-per-minute", type=int)
+    parser.add_argument(
+        "--base-url",
+        help="Benchmark an already running server instead of starting one",
+    )
+    parser.add_argument("--output", help="Also write per-task results as JSONL")
+    add_server_arguments(parser)
+    # An ephemeral port, so several benchmarks can run side by side
+    parser.set_defaults(port=0)
+
+    summary = asyncio.run(run_benchmark(parser.parse_args()))
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,439 @@
+# Stand-in for an OpenAI-compatible endpoint that streams synthetic chat
+# completions, for benchmarking the agent loop without a provider. Point the
+# agent at it with BASE_URL=http://127.0.0.1:<port>/v1
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any
+
+WORDS = (
+    "the agent reads files runs tools and streams text back to the user "
+    "while the model decides which call to make next"
+).split()
+
+
+@dataclass
+class ServerOptions:
+    host: str = "127.0.0.1"
+    port: int = 8765
+    # Seconds before the first chunk, then a steady token rate
+    ttft: float = 0.2
+    tokens_per_second: float = 100.0
+    response_tokens: int = 50
+    # The first tool_turns responses after each user message call tools
+    tool_turns: int = 1
+    tool_calls_per_turn: int = 2
+    tool_name: str = "read_file"
+    tool_arguments: dict[str, Any] = field(
+        default_factory=lambda: {"path": "README.md"}
+    )
+    # Fraction of requests answered with 429, and of streams cut off halfway
+    rate_limit_rate: float = 0.0
+    retry_after: float | None = 1.0
+    drop_rate: float = 0.0
+    seed: int | None = None
+
+
+@dataclass
+class ServerStats:
+    requests: int = 0
+    completed: int = 0
+    rate_limited: int = 0
+    dropped: int = 0
+    connections: int = 0
+    completion_tokens: int = 0
+
+    def to_dict(self) -> dict[str, Any]:
+        return dict(self.__dict__)
+
+
+class _DroppedConnection(Exception):
+    pass
+
+
+class FakeOpenAIServer:
+    def __init__(self, options: ServerOptions | None = None) -> None:
+        self.options = options or ServerOptions()
+        self.stats = ServerStats()
+        self._random = random.Random(self.options.seed)
+        self._server: asyncio.Server | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.options.host}:{self.port}/v1"
+
+    @property
+    def port(self) -> int:
+        if self._server is not None and self._server.sockets:
+            return self._server.sockets[0].getsockname()[1]
+        return self.options.port
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(
+            self._handle_connection,
+            self.options.host,
+            self.options.port,
+        )
+
+    async def serve_forever(self) -> None:
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        self.stats.connections += 1
+        try:
+            # HTTP/1.1 keep-alive: serve requests until the client hangs up
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, body = request
+                await self._dispatch(method, path, body, writer)
+        except (_DroppedConnection, ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _read_request(
+        self, reader: asyncio.StreamReader
+    ) -> tuple[str, str, bytes] | None:
+        request_line = await reader.readline()
+        if not request_line.strip():
+            return None
+
+        method, path, _ = request_line.decode("latin-1").split(" ", 2)
+        headers: dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length", 0))
+        body = await reader.readexactly(length) if length else b""
+        return method, path, body
+
+    async def _dispatch(
+        self,
+        method: str,
+        path: str,
+        body: bytes,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        path = path.split("?", 1)[0]
+        if method == "GET" and path.endswith("/models"):
+            await self._send_json(writer, 200, {"object": "list", "data": []})
+        elif method == "GET" and "/models/" in path:
+            model = path.rsplit("/", 1)[1]
+            await self._send_json(
+                writer,
+                200,
+                {"id": model, "object": "model", "created": 0, "owned_by": "bench"},
+            )
+        elif method == "POST" and path.endswith("/chat/completions"):
+            await self._chat_completion(json.loads(body or b"{}"), writer)
+        else:
+            await self._send_json(writer, 404, {"error": {"message": "Not found"}})
+
+    async def _chat_completion(
+        self, request: dict[str, Any], writer: asyncio.StreamWriter
+    ) -> None:
+        self.stats.requests += 1
+        options = self.options
+
+        if self._random.random() < options.rate_limit_rate:
+            self.stats.rate_limited += 1
+            headers = {}
+            if options.retry_after is not None:
+                headers["retry-after"] = f"{options.retry_after:g}"
+            await self._send_json(
+                writer,
+                429,
+                {"error": {"message": "Rate limit exceeded", "type": "rate_limit"}},
+                headers,
+            )
+            return
+
+        chunks = self._build_chunks(request)
+        usage = {
+            "prompt_tokens": _estimate_prompt_tokens(request),
+            "completion_tokens": len(chunks),
+            "total_tokens": 0,
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        await asyncio.sleep(options.ttft)
+        if not request.get("stream"):
+            await asyncio.sleep(len(chunks) / options.tokens_per_second)
+            await self._send_json(writer, 200, _completion(request, chunks, usage))
+            self.stats.completed += 1
+            self.stats.completion_tokens += len(chunks)
+            return
+
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"content-type: text/event-stream\r\n"
+            b"cache-control: no-cache\r\n"
+            b"transfer-encoding: chunked\r\n\r\n"
+        )
+
+        drop_at = None
+        if self._random.random() < options.drop_rate:
+            drop_at = len(chunks) // 2
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        interval = 1 / options.tokens_per_second
+
+        for idx, chunk in enumerate(chunks):
+            if idx == drop_at:
+                self.stats.dropped += 1
+                # Abort without the terminating chunk, like a reset connection
+                writer.transport.abort()
+                raise _DroppedConnection()
+            if idx:
+                await asyncio.sleep(interval)
+            await self._send_event(writer, _chunk(request, completion_id, **chunk))
+
+        if (request.get("stream_options") or {}).get("include_usage"):
+            await self._send_event(
+                writer, _chunk(request, completion_id, usage=usage, choices=[])
+            )
+        # [DONE] and the end of the chunked body go out together, so clients
+        # that stop reading at [DONE] can still reuse the connection
+        await self._send_event(writer, None, last=True)
+
+        self.stats.completed += 1
+        self.stats.completion_tokens += len(chunks)
+
+    def _build_chunks(self, request: dict[str, Any]) -> list[dict[str, Any]]:
+        options = self.options
+        messages = request.get("messages", [])
+
+        # Responses since the most recent user message decide whether this
+        # turn calls tools or finishes with text
+        turns_since_user = 0
+        for message in reversed(messages):
+            if message.get("role") == "user":
+                break
+            if message.get("role") == "assistant":
+                turns_since_user += 1
+
+        chunks: list[dict[str, Any]] = []
+        words = [
+            WORDS[self._random.randrange(len(WORDS))] + " "
+            for _ in range(options.response_tokens)
+        ]
+
+        if request.get("tools") and turns_since_user < options.tool_turns:
+            chunks.extend({"content": word} for word in words[:5])
+            arguments = json.dumps(options.tool_arguments)
+            for idx in range(options.tool_calls_per_turn):
+                call_id = f"call_{uuid.uuid4().hex[:12]}"
+                # Arguments arrive in a few pieces, as they do from providers
+                pieces = [arguments[i : i + 8] for i in range(0, len(arguments), 8)]
+                for piece_idx, piece in enumerate(pieces):
+                    tool_call: dict[str, Any] = {
+                        "index": idx,
+                        "function": {"arguments": piece},
+                    }
+                    if piece_idx == 0:
+                        tool_call["id"] = call_id
+                        tool_call["type"] = "function"
+                        tool_call["function"]["name"] = options.tool_name
+                    chunks.append({"tool_calls": [tool_call]})
+            chunks.append({"finish_reason": "tool_calls"})
+        else:
+            chunks.extend({"content": word} for word in words)
+            chunks.append({"finish_reason": "stop"})
+
+        return chunks
+
+    async def _send_event(
+        self,
+        writer: asyncio.StreamWriter,
+        data: dict[str, Any] | None,
+        last: bool = False,
+    ) -> None:
+        payload = "[DONE]" if data is None else json.dumps(data)
+        event = f"data: {payload}\n\n".encode("utf-8")
+        frame = f"{len(event):x}\r\n".encode("ascii") + event + b"\r\n"
+        if last:
+            frame += b"0\r\n\r\n"
+        writer.write(frame)
+        await writer.drain()
+
+    async def _send_json(
+        self,
+        writer: asyncio.StreamWriter,
+        status: int,
+        data: dict[str, Any],
+        headers: dict[str, str] | None = None,
+    ) -> None:
+        body = json.dumps(data).encode("utf-8")
+        reason = {200: "OK", 404: "Not Found", 429: "Too Many Requests"}[status]
+        head = [
+            f"HTTP/1.1 {status} {reason}",
+            "content-type: application/json",
+            f"content-length: {len(body)}",
+        ]
+        head.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+
+def _estimate_prompt_tokens(request: dict[str, Any]) -> int:
+    return len(json.dumps(request.get("messages", []))) // 4
+
+
+def _chunk(
+    request: dict[str, Any],
+    completion_id: str,
+    content: str | None = None,
+    tool_calls: list[dict[str, Any]] | None = None,
+    finish_reason: str | None = None,
+    usage: dict[str, int] | None = None,
+    choices: list[dict[str, Any]] | None = None,
+) -> dict[str, Any]:
+    if choices is None:
+        delta: dict[str, Any] = {}
+        if content is not None:
+            delta["content"] = content
+        if tool_calls is not None:
+            delta["tool_calls"] = tool_calls
+        choices = [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+
+    data = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": request.get("model", "fake"),
+        "choices": choices,
+    }
+    if usage is not None:
+        data["usage"] = usage
+    return data
+
+
+def _completion(
+    request: dict[str, Any],
+    chunks: list[dict[str, Any]],
+    usage: dict[str, int],
+) -> dict[str, Any]:
+    content = "".join(chunk.get("content", "") for chunk in chunks)
+    tool_calls: dict[int, dict[str, Any]] = {}
+    for chunk in chunks:
+        for tool_call in chunk.get("tool_calls", []):
+            entry = tool_calls.setdefault(
+                tool_call["index"],
+                {
+                    "id": tool_call.get("id"),
+                    "type": "function",
+                    "function": {"name": "", "arguments": ""},
+                },
+            )
+            function = tool_call["function"]
+            entry["function"]["name"] += function.get("name", "")
+            entry["function"]["arguments"] += function.get("arguments", "")
+
+    message: dict[str, Any] = {"role": "assistant", "content": content or None}
+    if tool_calls:
+        message["tool_calls"] = list(tool_calls.values())
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.get("model", "fake"),
+        "choices": [
+            {
+                "index": 0,
+                "message": message,
+                "finish_reason": chunks[-1].get("finish_reason", "stop"),
+            }
+        ],
+        "usage": usage,
+    }
+
+
+def add_server_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = ServerOptions()
+    parser.add_argument("--host", default=defaults.host)
+    parser.add_argument("--port", type=int, default=defaults.port)
+    parser.add_argument("--ttft", type=float, default=defaults.ttft)
+    parser.add_argument(
+        "--tokens-per-second", type=float, default=defaults.tokens_per_second
+    )
+    parser.add_argument("--response-tokens", type=int, default=defaults.response_tokens)
+    parser.add_argument("--tool-turns", type=int, default=defaults.tool_turns)
+    parser.add_argument(
+        "--tool-calls-per-turn", type=int, default=defaults.tool_calls_per_turn
+    )
+    parser.add_argument("--tool-name", default=defaults.tool_name)
+    parser.add_argument(
+        "--tool-arguments",
+        type=json.loads,
+        default=defaults.tool_arguments,
+        help="JSON object passed as the arguments of every tool call",
+    )
+    parser.add_argument("--rate-limit-rate", type=float, default=defaults.rate_limit_rate)
+    parser.add_argument("--retry-after", type=float, default=defaults.retry_after)
+    parser.add_argument("--drop-rate", type=float, default=defaults.drop_rate)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+
+
+def options_from_args(args: argparse.Namespace) -> ServerOptions:
+    return ServerOptions(
+        host=args.host,
+        port=args.port,
+        ttft=args.ttft,
+        tokens_per_second=args.tokens_per_second,
+        response_tokens=args.response_tokens,
+        tool_turns=args.tool_turns,
+        tool_calls_per_turn=args.tool_calls_per_turn,
+        tool_name=args.tool_name,
+        tool_arguments=args.tool_arguments,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        drop_rate=args.drop_rate,
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible server")
+    add_server_arguments(parser)
+    server = FakeOpenAIServer(options_from_args(parser.parse_args()))
+
+    async def serve() -> None:
+        await server.start()
+        print(f"Serving on {server.base_url}", flush=True)
+        await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+from __future__ import annotations
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import Any, AsyncIterator
+
+from openai import AsyncOpenAI
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+logger = logging.getLogger(__name__)
+
+# Request fields that select the response; everything else (timeouts, extra
+# headers) is ignored when matching a request to a recording
+REQUEST_HASH_FIELDS = (
+    "model",
+    "messages",
+    "tools",
+    "tool_choice",
+    "stream",
+    "temperature",
+)
+
+
+class CassetteMissError(LookupError):
+    pass
+
+
+def request_hash(kwargs: dict[str, Any]) -> str:
+    request = {key: kwargs[key] for key in REQUEST_HASH_FIELDS if key in kwargs}
+    payload = json.dumps(request, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._recordings: dict[str, deque[dict[str, Any]]] = defaultdict(deque)
+        self._lock = threading.Lock()
+
+    def load(self) -> Cassette:
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._recordings[entry["request_hash"]].append(entry)
+        return self
+
+    def take(self, kwargs: dict[str, Any]) -> dict[str, Any]:
+        # Identical requests are served in the order they were recorded
+        key = request_hash(kwargs)
+        recordings = self._recordings.get(key)
+        if not recordings:
+            raise CassetteMissError(
+                f"No recording for request {key[:12]} in {self.path}"
+            )
+        return recordings.popleft()
+
+    def append(self, kwargs: dict[str, Any], entry: dict[str, Any]) -> None:
+        entry = {
+            "request_hash": request_hash(kwargs),
+            "request": {
+                key: kwargs[key] for key in REQUEST_HASH_FIELDS if key in kwargs
+            },
+            **entry,
+        }
+        line = json.dumps(entry, default=str) + "\n"
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+
+class _RecordingStream:
+    def __init__(self, response: Any, cassette: Cassette, kwargs: dict[str, Any]) -> None:
+        self._response = response
+        self._cassette = cassette
+        self._kwargs = kwargs
+
+    def __aiter__(self) -> AsyncIterator[Any]:
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncIterator[Any]:
+        started_at = time.perf_counter()
+        chunks: list[dict[str, Any]] = []
+        async for chunk in self._response:
+            chunks.append(
+                {
+                    "offset": time.perf_counter() - started_at,
+                    "chunk": chunk.model_dump(mode="json", exclude_unset=True),
+                }
+            )
+            yield chunk
+
+        # Only complete streams are recorded; a dropped one would replay as
+        # a truncated response
+        self._cassette.append(self._kwargs, {"chunks": chunks})
+
+    async def close(self) -> None:
+        await self._response.close()
+
+
+class _ReplayStream:
+    def __init__(self, chunks: list[dict[str, Any]], realtime: bool) -> None:
+        self._chunks = chunks
+        self._realtime = realtime
+
+    def __aiter__(self) -> AsyncIterator[ChatCompletionChunk]:
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncIterator[ChatCompletionChunk]:
+        started_at = time.perf_counter()
+        for recorded in self._chunks:
+            if self._realtime:
+                delay = recorded["offset"] - (time.perf_counter() - started_at)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield ChatCompletionChunk.model_validate(recorded["chunk"])
+
+    async def close(self) -> None:
+        pass
+
+
+class _Completions:
+    def __init__(self, owner: CassetteClient) -> None:
+        self._owner = owner
+
+    async def create(self, **kwargs: Any) -> Any:
+        return await self._owner.create(kwargs)
+
+
+class _Chat:
+    def __init__(self, owner: CassetteClient) -> None:
+        self.completions = _Completions(owner)
+
+
+class CassetteClient:
+    # Stands in for AsyncOpenAI, exposing only chat.completions.create. In
+    # record mode requests go to the wrapped client and are written to the
+    # cassette; in replay mode they are served from it without a network
+    def __init__(
+        self,
+        cassette: Cassette,
+        client: AsyncOpenAI | None = None,
+        realtime: bool = False,
+    ) -> None:
+        self.cassette = cassette
+        self._client = client
+        self._realtime = realtime
+        self.chat = _Chat(self)
+
+    @property
+    def is_replaying(self) -> bool:
+        return self._client is None
+
+    async def create(self, kwargs: dict[str, Any]) -> Any:
+        if self.is_replaying:
+            return await self._replay(kwargs)
+
+        response = await self._client.chat.completions.create(**kwargs)
+        if kwargs.get("stream"):
+            return _RecordingStream(response, self.cassette, kwargs)
+
+        self.cassette.append(
+            kwargs,
+            {"response": response.model_dump(mode="json", exclude_unset=True)},
+        )
+        return response
+
+    async def _replay(self, kwargs: dict[str, Any]) -> Any:
+        entry = self.cassette.take(kwargs)
+        if kwargs.get("stream"):
+            return _ReplayStream(entry.get("chunks", []), self._realtime)
+        return ChatCompletion.model_validate(entry["response"])
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.close()
@@ -1,6 +1,21 @@
 import asyncio
-from typing import Any, AsyncGenerator
-from openai import APIConnectionError, APIError, AsyncOpenAI, RateLimitError
+import importlib
+import json
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncGenerator, Sequence
+from openai import (
+    DEFAULT_CONNECTION_LIMITS,
+    APIConnectionError,
+    APIError,
+    APIStatusError,
+    AsyncOpenAI,
+    DefaultAsyncHttpxClient,
+    InternalServerError,
+    RateLimitError,
+)
 from dotenv import load_dotenv
 
 from client.response import (
@@ -10,56 +25,208 @@ from client.response import (
     TokenUsage,
     ToolCall,
     ToolCallDelta,
+    is_complete_arguments,
     parse_tool_call_arguments,
+    to_openai_tool,
 )
+from client.cassette import Cassette, CassetteClient, CassetteMissError
+from client.rate_limiter import RateLimiter, RateLimitReservation, get_rate_limiter
+from client.stream_resume import StreamResumer
 from config.config import Config
+from utils.calibration import get_calibration
+from utils.text import count_tokens, estimate_tokens
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {408, 409}
+
+# The HTTP library the installed SDK is built on (httpx, or httpx2 from
+# openai 3), so pool settings match its transport whichever it is
+_http = importlib.import_module(type(DEFAULT_CONNECTION_LIMITS).__module__)
+# openai 2.x does not wrap transport errors raised while a stream is being
+# read, e.g. a dropped chunked body, so they are caught alongside its own
+CONNECTION_ERRORS = (APIConnectionError, _http.TransportError)
+
+
+def _parse_usage(usage: Any) -> TokenUsage:
+    details = getattr(usage, "prompt_tokens_details", None)
+    return TokenUsage(
+        prompt_tokens=usage.prompt_tokens or 0,
+        completion_tokens=usage.completion_tokens or 0,
+        total_tokens=usage.total_tokens or 0,
+        cached_tokens=(getattr(details, "cached_tokens", None) or 0),
+    )
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, (RateLimitError, InternalServerError, *CONNECTION_ERRORS)):
+        return True
+    return (
+        isinstance(error, APIStatusError)
+        and error.status_code in RETRYABLE_STATUS_CODES
+    )
+
+
+def _describe_error(error: Exception) -> str:
+    if isinstance(error, RateLimitError):
+        return f"Rate limit exceeded: {error}"
+    if isinstance(error, CONNECTION_ERRORS):
+        return f"API connection error: {error}"
+    return f"API error: {error}"
+
+
+def _get_retry_after(error: Exception) -> float | None:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        # Retry-After may also be an HTTP date
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _tool_call_complete(tool_call: dict[str, Any]) -> StreamEvent:
+    return StreamEvent(
+        type=StreamEventType.TOOL_CALL_COMPLETE,
+        tool_call=ToolCall(
+            call_id=tool_call["id"],
+            name=tool_call["name"],
+            arguments=parse_tool_call_arguments(tool_call["arguments"]),
+        ),
+    )
+
+
+def _create_http_client(config: Config) -> DefaultAsyncHttpxClient:
+    client_config = config.client
+    limits = _http.Limits(
+        max_connections=client_config.max_connections,
+        max_keepalive_connections=client_config.max_keepalive_connections,
+        keepalive_expiry=client_config.keepalive_expiry,
+    )
+    if client_config.http2:
+        try:
+            return DefaultAsyncHttpxClient(limits=limits, http2=True)
+        except ImportError:
+            logger.warning("HTTP/2 requires the h2 package; using HTTP/1.1")
+    return DefaultAsyncHttpxClient(limits=limits)
+
+
+def create_openai_client(config: Config) -> AsyncOpenAI | CassetteClient:
+    client_config = config.client
+    if client_config.cassette_mode == "replay":
+        return CassetteClient(
+            Cassette(client_config.cassette_path).load(),
+            realtime=client_config.cassette_realtime,
+        )
+
+    client = AsyncOpenAI(
+        api_key=config.api_key,
+        base_url=config.base_url,
+        timeout=config.client.request_timeout,
+        # Retries are handled by LLMClient, which knows about partial streams
+        max_retries=0,
+        http_client=_create_http_client(config),
+    )
+    if client_config.cassette_mode == "record":
+        return CassetteClient(Cassette(client_config.cassette_path), client)
+    return client
+
 
 class LLMClient:
-    def __init__(self, config: Config) -> None:
-        self._client: AsyncOpenAI | None = None
-        self._max_retries: int = 3
+    def __init__(
+        self,
+        config: Config,
+        client: AsyncOpenAI | CassetteClient | None = None,
+    ) -> None:
+        # A client passed in is shared with other agents (and its connection
+        # pool with it), so it is left open for its owner to close
+        self._client: AsyncOpenAI | CassetteClient | None = client
+        self._owns_client = client is None
         self.config = config
+        self._rate_limiter = get_rate_limiter(config)
+        self._tools_tokens: tuple[Sequence[dict[str, Any]], int] | None = None
 
-    def get_client(self) -> AsyncOpenAI:
+    def get_client(self) -> AsyncOpenAI | CassetteClient:
         if self._client is None:
-            self._client = AsyncOpenAI(
-                api_key=self.config.api_key,
-                base_url=self.config.base_url,
-            )
+            self._client = create_openai_client(self.config)
+            self._owns_client = True
         return self._client
 
+    @property
+    def rate_limiter(self) -> RateLimiter | None:
+        return self._rate_limiter
+
+    async def prewarm(self) -> None:
+        client = self.get_client()
+        if isinstance(client, CassetteClient):
+            return
+
+        # Any cheap authenticated request will do; it leaves a connection in
+        # the pool for the first real request to reuse. Retrieving a single
+        # model keeps the body small, unlike listing every model
+        try:
+            await asyncio.wait_for(
+                client.models.retrieve(self.config.model_name),
+                timeout=self.config.client.prewarm_timeout,
+            )
+        except Exception as e:
+            logger.debug(f"Connection pre-warm failed: {e}")
+
     async def close(self) -> None:
         if self._client is not None:
-            await self._client.close()
+            if self._owns_client:
+                await self._client.close()
             self._client = None
 
-    def _build_tools(self, tools: list[dict[str, Any]]):
-        return [
-            {
-                "type": "function",
-                "function": {
-                    "name": tool["name"],
-                    "description": tool.get("description", ""),
-                    "parameters": tool.get(
-                        "parameters",
-                        {
-                            "type": "object",
-                            "properties": {},
-                        },
-                    ),
-                },
-            }
-            for tool in tools
-        ]
+    def _build_tools(self, tools: Sequence[dict[str, Any]]):
+        return [to_openai_tool(tool) for tool in tools]
+
+    def _record_usage(
+        self,
+        usage: TokenUsage,
+        prompt_tokens: int,
+        tools: Sequence[dict[str, Any]] | None,
+    ) -> None:
+        local_tokens = prompt_tokens
+        if tools:
+            local_tokens += self._count_tool_tokens(tools)
+        get_calibration(self.config.model_name).observe_usage(
+            local_tokens,
+            usage.prompt_tokens,
+        )
+
+    def _count_tool_tokens(self, tools: Sequence[dict[str, Any]]) -> int:
+        # The registry hands out the same payload object until it changes
+        if self._tools_tokens is None or self._tools_tokens[0] is not tools:
+            tokens = count_tokens(json.dumps(tools), self.config.model_name)
+            self._tools_tokens = (tools, tokens)
+        return self._tools_tokens[1]
 
     async def chat_completion(
         self,
         messages: list[dict[str, Any]],
-        tools: list[dict[str, Any]] | None = None,
+        tools: Sequence[dict[str, Any]] | None = None,
         stream: bool = True,
+        prompt_tokens: int | None = None,
     ) -> AsyncGenerator[StreamEvent, None]:
         client = self.get_client()
 
@@ -68,139 +235,263 @@ class LLMClient:
             "messages": messages,
             "stream": stream,
         }
+        if stream:
+            kwargs["stream_options"] = {"include_usage": True}
         if tools:
             kwargs["tools"] = self._build_tools(tools)
             kwargs["tool_choice"] = "auto"
 
-        for attempt in range(self._max_retries + 1):
+        resumer = StreamResumer()
+        queue_time = 0.0
+        max_retries = self.config.client.max_retries
+        for attempt in range(max_retries + 1):
+            reservation: RateLimitReservation | None = None
             try:
+                if self._rate_limiter is not None:
+                    reservation = await self._rate_limiter.acquire(
+                        self._estimate_request_tokens(messages, prompt_tokens, tools)
+                    )
+                    queue_time += reservation.queue_time
+
                 if stream:
+                    resumer.begin_attempt()
                     async for event in self._stream_response(client, kwargs):
-                        yield event
+                        for filtered in resumer.filter(event):
+                            self._on_event(
+                                filtered, reservation, queue_time, prompt_tokens, tools
+                            )
+                            yield filtered
                 else:
                     event = await self._non_stream_response(client, kwargs)
+                    self._on_event(event, reservation, queue_time, prompt_tokens, tools)
                     yield event
 
                 return
 
-            except RateLimitError as e:
-                if attempt < self._max_retries:
-                    wait_time = 2**attempt
-                    await asyncio.sleep(wait_time)
-                else:
-                    yield StreamEvent(
-                        type=StreamEventType.ERROR,
-                        error=f"Rate limit exceeded: {e}",
-                    )
-                    return
-            except APIConnectionError as e:
-                if attempt < self._max_retries:
-                    wait_time = 2**attempt
-                    await asyncio.sleep(wait_time)
-                else:
-                    yield StreamEvent(
-                        type=StreamEventType.ERROR,
-                        error=f"API connection error: {e}",
+            except (RateLimitError, APIStatusError, *CONNECTION_ERRORS) as e:
+                if isinstance(e, RateLimitError) and reservation is not None:
+                    # Rejected requests don't use up the token quota, but the
+                    # provider's backoff applies to every session sharing it
+                    reservation.settle(0)
+                    retry_after = _get_retry_after(e)
+                    if retry_after is not None:
+                        self._rate_limiter.pause(retry_after)
+
+                delay = self._retry_delay(attempt, e) if _is_retryable(e) else None
+                if attempt < max_retries and delay is not None:
+                    logger.warning(
+                        f"Model request failed ({e.__class__.__name__}), "
+                        f"retrying in {delay:.1f}s"
                     )
-                    return
+                    await asyncio.sleep(delay)
+                    continue
 
+                yield StreamEvent(
+                    type=StreamEventType.ERROR,
+                    error=_describe_error(e),
+                )
+                return
             except APIError as e:
                 yield StreamEvent(
                     type=StreamEventType.ERROR,
                     error=f"API error: {e}",
                 )
                 return
+            except TimeoutError:
+                yield StreamEvent(
+                    type=StreamEventType.ERROR,
+                    error="Model request timed out",
+                )
+                return
+            except CassetteMissError as e:
+                yield StreamEvent(
+                    type=StreamEventType.ERROR,
+                    error=str(e),
+                )
+                return
+
+    def _on_event(
+        self,
+        event: StreamEvent,
+        reservation: RateLimitReservation | None,
+        queue_time: float,
+        prompt_tokens: int | None,
+        tools: Sequence[dict[str, Any]] | None,
+    ) -> None:
+        if event.type != StreamEventType.MESSAGE_COMPLETE:
+            return
+
+        event.queue_time = queue_time
+        if event.usage:
+            if reservation is not None:
+                reservation.settle(event.usage.total_tokens)
+            if prompt_tokens is not None:
+                self._record_usage(event.usage, prompt_tokens, tools)
+
+    def _estimate_request_tokens(
+        self,
+        messages: list[dict[str, Any]],
+        prompt_tokens: int | None,
+        tools: Sequence[dict[str, Any]] | None,
+    ) -> int:
+        if prompt_tokens is None:
+            local_tokens = estimate_tokens(json.dumps(messages), self.config.model_name)
+        else:
+            local_tokens = prompt_tokens
+        if tools:
+            local_tokens += self._count_tool_tokens(tools)
+        return get_calibration(self.config.model_name).to_provider_tokens(local_tokens)
+
+    def _retry_delay(self, attempt: int, error: Exception) -> float | None:
+        client_config = self.config.client
+        retry_after = _get_retry_after(error)
+        if retry_after is not None:
+            if retry_after > client_config.retry_max_delay:
+                return None
+            # Clients told the same Retry-After shouldn't all return at once
+            return retry_after + random.uniform(0, client_config.retry_base_delay)
+
+        # Full jitter, so sessions that failed together retry at different times
+        return random.uniform(
+            0,
+            min(
+                client_config.retry_max_delay,
+                client_config.retry_base_delay * 2**attempt,
+            ),
+        )
 
     async def _stream_response(
         self, 
         client: AsyncOpenAI, 
         kwargs: dict[str, Any],
     ) -> AsyncGenerator[StreamEvent, None]:
-        response = await client.chat.completions.create(**kwargs)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.config.client.request_timeout
+        response = await asyncio.wait_for(
+            client.chat.completions.create(**kwargs),
+            timeout=self.config.client.request_timeout,
+        )
 
         finish_reason: str | None = None
         usage: TokenUsage | None = None
         tool_calls: dict[int, dict[str, Any]] = {}
+        completed: set[int] = set()
 
-        async for chunk in response:
-            if hasattr(chunk, "usage") and chunk.usage:
-                usage = TokenUsage(
-                    prompt_tokens=chunk.usage.prompt_tokens,
-                    completion_tokens=chunk.usage.completion_tokens,
-                    total_tokens=chunk.usage.total_tokens,
-                    cached_tokens=chunk.usage.prompt_tokens_details.cached_tokens,
-                )
-            
-            if not chunk.choices:
-                continue
+        chunks = self._iter_chunks(response, deadline)
+        try:
+            async for chunk in chunks:
+                if hasattr(chunk, "usage") and chunk.usage:
+                    usage = _parse_usage(chunk.usage)
 
-            choice = chunk.choices[0]
-            delta = choice.delta
+                if not chunk.choices:
+                    continue
 
-            if choice.finish_reason:
-                finish_reason = choice.finish_reason
+                choice = chunk.choices[0]
+                delta = choice.delta
 
-            if delta.content:
-                yield StreamEvent(
-                    type=StreamEventType.TEXT_DELTA,
-                    text_delta=TextDelta(delta.content),
-                )
+                if choice.finish_reason:
+                    finish_reason = choice.finish_reason
 
-            if delta.tool_calls:
-                for tool_call_delta in delta.tool_calls:
-                    idx = tool_call_delta.index
+                if delta.content:
+                    yield StreamEvent(
+                        type=StreamEventType.TEXT_DELTA,
+                        text_delta=TextDelta(delta.content),
+                    )
+
+                if delta.tool_calls:
+                    for tool_call_delta in delta.tool_calls:
+                        idx = tool_call_delta.index
+                        function = tool_call_delta.function
+
+                        if idx not in tool_calls:
+                            # A new index means every earlier call is finished
+                            for prev_idx in list(tool_calls):
+                                if prev_idx not in completed:
+                                    completed.add(prev_idx)
+                                    yield _tool_call_complete(tool_calls[prev_idx])
 
-                    if idx not in tool_calls:
-                        tool_calls[idx] = {
-                            "id": tool_call_delta.id or "",
-                            "name": "",
-                            "arguments": "",
-                        }
+                            tool_calls[idx] = {
+                                "id": tool_call_delta.id or "",
+                                "name": "",
+                                "arguments": "",
+                            }
 
-                        if tool_call_delta.function:
-                            if tool_call_delta.function.name:
-                                tool_calls[idx]["name"] = tool_call_delta.function.name
+                            if function and function.name:
+                                tool_calls[idx]["name"] = function.name
                                 yield StreamEvent(
                                     type=StreamEventType.TOOL_CALL_START,
                                     tool_call_delta=ToolCallDelta(
                                         call_id=tool_calls[idx]["id"],
-                                        name=tool_call_delta.function.name,
+                                        name=function.name,
                                     ),
                                 )
+                        elif idx in completed:
+                            continue
 
-                        if tool_call_delta.function.arguments:
-                            tool_calls[idx]["arguments"] += (
-                                tool_call_delta.function.arguments
-                            )
+                        tc = tool_calls[idx]
+                        if tool_call_delta.id and not tc["id"]:
+                            tc["id"] = tool_call_delta.id
+                        if function and function.name and not tc["name"]:
+                            tc["name"] = function.name
+
+                        if function and function.arguments:
+                            tc["arguments"] += function.arguments
                             yield StreamEvent(
                                 type=StreamEventType.TOOL_CALL_DELTA,
                                 tool_call_delta=ToolCallDelta(
-                                    call_id=tool_calls[idx]["id"],
-                                    name=tool_call_delta.function.name,
-                                    arguments_delta=tool_call_delta.function.arguments,
+                                    call_id=tc["id"],
+                                    name=tc["name"],
+                                    arguments_delta=function.arguments,
                                 ),
                             )
 
-        for idx, tc in tool_calls.items():
+                            # Only a closing brace can complete the object, so
+                            # skip the parse attempt for every other delta
+                            if "}" in function.arguments and is_complete_arguments(
+                                tc["arguments"]
+                            ):
+                                completed.add(idx)
+                                yield _tool_call_complete(tc)
+
+            for idx, tc in tool_calls.items():
+                if idx not in completed:
+                    yield _tool_call_complete(tc)
+
             yield StreamEvent(
-                type=StreamEventType.TOOL_CALL_COMPLETE,
-                tool_call=ToolCall(
-                    call_id=tc["id"],
-                    name=tc["name"],
-                    arguments=parse_tool_call_arguments(tc["arguments"]),
-                ),
+                type=StreamEventType.MESSAGE_COMPLETE,
+                finish_reason=finish_reason,
+                usage=usage,
             )
+        finally:
+            # Closes the HTTP stream on completion, error or cancellation
+            await chunks.aclose()
+            await response.close()
 
-        yield StreamEvent(
-            type=StreamEventType.MESSAGE_COMPLETE,
-            finish_reason=finish_reason,
-            usage=usage,
-        )
+    async def _iter_chunks(
+        self, response: Any, deadline: float
+    ) -> AsyncGenerator[Any, None]:
+        loop = asyncio.get_running_loop()
+        iterator = response.__aiter__()
+        while True:
+            timeout = min(
+                self.config.client.stream_idle_timeout,
+                deadline - loop.time(),
+            )
+            if timeout <= 0:
+                raise TimeoutError("Model request deadline exceeded")
+            try:
+                chunk = await asyncio.wait_for(anext(iterator), timeout=timeout)
+            except StopAsyncIteration:
+                return
+            yield chunk
 
     async def _non_stream_response(
         self, client: AsyncOpenAI, kwargs: dict[str, Any]
     ) -> StreamEvent:
-        response = await client.chat.completions.create(**kwargs)
+        response = await asyncio.wait_for(
+            client.chat.completions.create(**kwargs),
+            timeout=self.config.client.request_timeout,
+        )
         choice = response.choices[0]
         message = choice.message
 
@@ -220,12 +511,7 @@ class LLMClient:
 
         usage = None
         if response.usage:
-            usage = TokenUsage(
-                prompt_tokens=response.usage.prompt_tokens,
-                completion_tokens=response.usage.completion_tokens,
-                total_tokens=response.usage.total_tokens,
-                cached_tokens=response.usage.prompt_tokens_details.cached_tokens,
-            )
+            usage = _parse_usage(response.usage)
 
         return StreamEvent(
             type=StreamEventType.MESSAGE_COMPLETE,
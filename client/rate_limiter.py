@@ -0,0 +1,143 @@
+from __future__ import annotations
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any
+
+from config.config import Config
+
+
+class _TokenBucket:
+    def __init__(self, per_minute: int) -> None:
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.rate = per_minute / 60
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        # A request larger than the whole bucket waits for a full bucket
+        # rather than forever
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+
+@dataclass
+class RateLimitReservation:
+    limiter: RateLimiter
+    tokens: int
+    queue_time: float
+
+    def settle(self, actual_tokens: int) -> None:
+        # Swap the estimate for what the provider actually counted; the
+        # bucket may go negative, which delays the next requests accordingly
+        self.limiter._adjust_tokens(actual_tokens - self.tokens)
+        self.tokens = actual_tokens
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        requests_per_minute: int | None = None,
+        tokens_per_minute: int | None = None,
+    ) -> None:
+        self._requests = _TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = _TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        # asyncio.Lock wakes waiters in arrival order, so requests are
+        # admitted first come, first served
+        self._lock = asyncio.Lock()
+        self._blocked_until = 0.0
+
+        self.acquired = 0
+        self.waiting = 0
+        self.total_queue_time = 0.0
+        self.max_queue_time = 0.0
+
+    async def acquire(self, tokens: int) -> RateLimitReservation:
+        started_at = time.monotonic()
+        self.waiting += 1
+        try:
+            async with self._lock:
+                while True:
+                    wait = self._wait_time(tokens)
+                    if wait <= 0:
+                        break
+                    await asyncio.sleep(wait)
+
+                if self._requests is not None:
+                    self._requests.level -= 1
+                if self._tokens is not None:
+                    self._tokens.level -= tokens
+        finally:
+            self.waiting -= 1
+
+        queue_time = time.monotonic() - started_at
+        self.acquired += 1
+        self.total_queue_time += queue_time
+        self.max_queue_time = max(self.max_queue_time, queue_time)
+        return RateLimitReservation(limiter=self, tokens=tokens, queue_time=queue_time)
+
+    def pause(self, seconds: float) -> None:
+        # A 429 seen by one session holds back every session sharing the key
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "acquired": self.acquired,
+            "waiting": self.waiting,
+            "total_queue_time": self.total_queue_time,
+            "max_queue_time": self.max_queue_time,
+            "mean_queue_time": (
+                self.total_queue_time / self.acquired if self.acquired else 0.0
+            ),
+        }
+
+    def _wait_time(self, tokens: int) -> float:
+        now = time.monotonic()
+        wait = self._blocked_until - now
+        if self._requests is not None:
+            self._requests.refill(now)
+            wait = max(wait, self._requests.wait_time(1))
+        if self._tokens is not None:
+            self._tokens.refill(now)
+            wait = max(wait, self._tokens.wait_time(tokens))
+        return wait
+
+    def _adjust_tokens(self, delta: int) -> None:
+        if self._tokens is not None:
+            self._tokens.refill(time.monotonic())
+            self._tokens.level = min(self._tokens.capacity, self._tokens.level - delta)
+
+
+_rate_limiters: dict[tuple[Any, ...], RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(config: Config) -> RateLimiter | None:
+    client_config = config.client
+    if not client_config.requests_per_minute and not client_config.tokens_per_minute:
+        return None
+
+    # Quotas belong to the endpoint and key, so every session in the process
+    # that uses them draws from the same buckets
+    key = (
+        config.base_url,
+        config.api_key,
+        client_config.requests_per_minute,
+        client_config.tokens_per_minute,
+    )
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(key)
+        if limiter is None:
+            limiter = RateLimiter(
+                requests_per_minute=client_config.requests_per_minute,
+                tokens_per_minute=client_config.tokens_per_minute,
+            )
+            _rate_limiters[key] = limiter
+        return limiter
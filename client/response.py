@@ -17,6 +17,9 @@ class StreamEventType(str, Enum):
     TEXT_DELTA = "text_delta"
     MESSAGE_COMPLETE = "message_complete"
     ERROR = "error"
+    # A retried stream diverged from what was already emitted; everything
+    # streamed before this event should be discarded
+    STREAM_RESET = "stream_reset"
 
     TOOL_CALL_START = "tool_call_start"
     TOOL_CALL_DELTA = "tool_call_delta"
@@ -30,6 +33,12 @@ class TokenUsage:
     total_tokens: int = 0
     cached_tokens: int = 0
 
+    @property
+    def cache_hit_ratio(self) -> float:
+        if not self.prompt_tokens:
+            return 0.0
+        return self.cached_tokens / self.prompt_tokens
+
     def __add__(self, other: TokenUsage):
         return TokenUsage(
             prompt_tokens=self.prompt_tokens + other.prompt_tokens,
@@ -62,6 +71,8 @@ class StreamEvent:
     tool_call_delta: ToolCallDelta | None = None
     tool_call: ToolCall | None = None
     usage: TokenUsage | None = None
+    # Seconds spent waiting on the client-side rate limiter, across retries
+    queue_time: float = 0.0
 
 
 @dataclass
@@ -69,6 +80,9 @@ class ToolResultMessage:
     tool_call_id: str
     content: str
     is_error: bool = False
+    tool_name: str | None = None
+    metadata: dict[str, Any] = field(default_factory=dict)
+    is_mutating: bool = False
 
     def to_openai_message(self) -> dict[str, Any]:
         return {
@@ -78,6 +92,26 @@ class ToolResultMessage:
         }
 
 
+def to_openai_tool(schema: dict[str, Any]) -> dict[str, Any]:
+    # Entries already in OpenAI format pass through unchanged
+    if schema.get("type") == "function":
+        return schema
+    return {
+        "type": "function",
+        "function": {
+            "name": schema["name"],
+            "description": schema.get("description", ""),
+            "parameters": schema.get(
+                "parameters",
+                {
+                    "type": "object",
+                    "properties": {},
+                },
+            ),
+        },
+    }
+
+
 def parse_tool_call_arguments(arguments_str: str) -> dict[str, Any]:
     if not arguments_str:
         return {}
@@ -85,3 +119,13 @@ def parse_tool_call_arguments(arguments_str: str) -> dict[str, Any]:
         return json.loads(arguments_str)
     except json.JSONDecodeError:
         return {"raw_arguments": arguments_str}
+
+
+def is_complete_arguments(arguments_str: str) -> bool:
+    stripped = arguments_str.rstrip()
+    if not stripped.endswith("}"):
+        return False
+    try:
+        return isinstance(json.loads(stripped), dict)
+    except json.JSONDecodeError:
+        return False
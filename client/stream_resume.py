@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+from client.response import StreamEvent, StreamEventType, TextDelta, ToolCall
+
+
+class StreamResumer:
+    # Tracks what one chat completion has already emitted so that, when the
+    # connection drops and the request is retried, the replayed output is
+    # suppressed up to where the previous attempt stopped. If the retry
+    # produces different output, a STREAM_RESET is emitted followed by the
+    # new output from the start.
+    def __init__(self) -> None:
+        self._text = ""
+        self._tool_calls: list[ToolCall] = []
+
+        self._replaying = False
+        self._replay_text = ""
+        self._replay_tool_calls: list[ToolCall] = []
+        self._new_text = ""
+        self._new_tool_calls: list[ToolCall] = []
+
+    @property
+    def has_emitted(self) -> bool:
+        return bool(self._text or self._tool_calls)
+
+    def begin_attempt(self) -> None:
+        if not self.has_emitted:
+            return
+
+        self._replaying = True
+        self._replay_text = self._text
+        self._replay_tool_calls = list(self._tool_calls)
+        self._new_text = ""
+        self._new_tool_calls = []
+
+    def filter(self, event: StreamEvent) -> list[StreamEvent]:
+        if not self._replaying:
+            self._record(event)
+            return [event]
+
+        if event.type == StreamEventType.TEXT_DELTA and event.text_delta:
+            self._new_text += event.text_delta.content
+            if self._replay_text.startswith(self._new_text):
+                return []
+
+            if (
+                self._new_text.startswith(self._replay_text)
+                and not self._replay_tool_calls
+            ):
+                # Caught up with the previous attempt; pass on only the rest
+                self._replaying = False
+                extra = self._new_text[len(self._replay_text) :]
+                self._text += extra
+                return [
+                    StreamEvent(
+                        type=StreamEventType.TEXT_DELTA,
+                        text_delta=TextDelta(extra),
+                    )
+                ]
+
+            return self._reset(None)
+
+        if event.type == StreamEventType.TOOL_CALL_COMPLETE and event.tool_call:
+            if self._caught_up():
+                # A call past everything the previous attempt emitted, such
+                # as the first call after replayed preface text
+                self._replaying = False
+                self._record(event)
+                return [event]
+
+            idx = len(self._new_tool_calls)
+            self._new_tool_calls.append(event.tool_call)
+            if (
+                self._new_text == self._replay_text
+                and idx < len(self._replay_tool_calls)
+                and _same_call(self._replay_tool_calls[idx], event.tool_call)
+            ):
+                # Already emitted under the original call id, which the
+                # consumer may have started executing
+                if idx + 1 == len(self._replay_tool_calls):
+                    self._replaying = False
+                return []
+
+            return self._reset(None)
+
+        if event.type in (
+            StreamEventType.TOOL_CALL_START,
+            StreamEventType.TOOL_CALL_DELTA,
+        ):
+            if self._caught_up():
+                self._replaying = False
+                return [event]
+            return []
+
+        if event.type == StreamEventType.MESSAGE_COMPLETE:
+            if self._caught_up():
+                self._replaying = False
+                return [event]
+            return self._reset(event)
+
+        return [event]
+
+    def _caught_up(self) -> bool:
+        return self._new_text == self._replay_text and len(
+            self._new_tool_calls
+        ) == len(self._replay_tool_calls)
+
+    def _record(self, event: StreamEvent) -> None:
+        if event.type == StreamEventType.TEXT_DELTA and event.text_delta:
+            self._text += event.text_delta.content
+        elif event.type == StreamEventType.TOOL_CALL_COMPLETE and event.tool_call:
+            self._tool_calls.append(event.tool_call)
+
+    def _reset(self, event: StreamEvent | None) -> list[StreamEvent]:
+        # The retry diverged: start over with everything the new attempt has
+        # produced so far
+        self._replaying = False
+        self._text = self._new_text
+        self._tool_calls = list(self._new_tool_calls)
+
+        events = [StreamEvent(type=StreamEventType.STREAM_RESET)]
+        if self._new_text:
+            events.append(
+                StreamEvent(
+                    type=StreamEventType.TEXT_DELTA,
+                    text_delta=TextDelta(self._new_text),
+                )
+            )
+        events.extend(
+            StreamEvent(type=StreamEventType.TOOL_CALL_COMPLETE, tool_call=tool_call)
+            for tool_call in self._new_tool_calls
+        )
+        if event is not None:
+            events.append(event)
+        return events
+
+
+def _same_call(a: ToolCall, b: ToolCall) -> bool:
+    return a.name == b.name and a.arguments == b.arguments
@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import Literal
 from pydantic import BaseModel, Field
 import os
 
@@ -7,13 +8,132 @@ class ModelConfig(BaseModel):
     name: str = "mistralai/devstral-2512"
     temperature: float = Field(default=1, ge=0.0, le=2.0)
     context_window: int = 256_000
+    # Prices in USD per million tokens; cost is only reported when the input
+    # and output prices are set. Cached prompt tokens fall back to the input
+    # price when no cached price is given
+    input_cost_per_mtok: float | None = Field(default=None, ge=0.0)
+    output_cost_per_mtok: float | None = Field(default=None, ge=0.0)
+    cached_input_cost_per_mtok: float | None = Field(default=None, ge=0.0)
+
+    def cost(
+        self,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cached_tokens: int = 0,
+    ) -> float | None:
+        if self.input_cost_per_mtok is None or self.output_cost_per_mtok is None:
+            return None
+
+        cached_price = self.cached_input_cost_per_mtok
+        if cached_price is None:
+            cached_price = self.input_cost_per_mtok
+        return (
+            (prompt_tokens - cached_tokens) * self.input_cost_per_mtok
+            + cached_tokens * cached_price
+            + completion_tokens * self.output_cost_per_mtok
+        ) / 1_000_000
+
+
+class ContextConfig(BaseModel):
+    # Fraction of the context window at which older turns get summarized
+    compaction_threshold: float = Field(default=0.8, gt=0.0, le=1.0)
+    keep_recent_turns: int = Field(default=4, ge=1)
+    compaction_input_tokens: int = Field(default=2000, ge=100)
+
+    # Tool outputs are replaced with short stubs once they are older than
+    # this many turns, once live outputs exceed the byte budget (oldest
+    # first), or once a later mutating tool touches the same path
+    tool_output_max_age_turns: int = Field(default=10, ge=1)
+    tool_output_budget_bytes: int = Field(default=256 * 1024, ge=0)
+    tool_output_min_evict_bytes: int = Field(default=1024, ge=0)
+    evict_superseded_outputs: bool = True
+    # Evictions rewrite history and invalidate the provider's prompt cache
+    # from that point on, so they are batched at most once per interval
+    # unless the byte budget is exceeded
+    eviction_interval_turns: int = Field(default=5, ge=1)
+
+    # Tool outputs at least this large that repeat an earlier live result
+    # are replaced with a reference to it
+    dedupe_min_bytes: int = Field(default=512, ge=0)
+
+    # Message contents at least this large are moved out of the Python heap
+    # into a memory-mapped session file and loaded when a request is built
+    spill_threshold_bytes: int = Field(default=32 * 1024, ge=0)
+    spill_dir: Path | None = None
+
+
+class ClientConfig(BaseModel):
+    # Overall deadline for one model request, including the whole stream
+    request_timeout: float = Field(default=600.0, gt=0)
+    # Longest allowed gap between two stream chunks
+    stream_idle_timeout: float = Field(default=120.0, gt=0)
+    # Retries of rate-limited, overloaded or dropped requests, with jittered
+    # exponential backoff. A Retry-After longer than retry_max_delay is not
+    # waited out; the request fails instead
+    max_retries: int = Field(default=3, ge=0)
+    retry_base_delay: float = Field(default=1.0, gt=0)
+    retry_max_delay: float = Field(default=60.0, gt=0)
+    # "record" writes every request and its stream to the cassette file;
+    # "replay" serves them back from it without contacting the provider.
+    # With cassette_realtime, replays keep the recorded chunk timing
+    cassette_mode: Literal["off", "record", "replay"] = "off"
+    cassette_path: Path | None = None
+    cassette_realtime: bool = False
+
+    # HTTP connection pool. Idle connections are kept open for
+    # keepalive_expiry seconds so consecutive turns skip TCP/TLS setup;
+    # http2 needs the optional h2 package and falls back to HTTP/1.1
+    max_connections: int = Field(default=100, ge=1)
+    max_keepalive_connections: int = Field(default=20, ge=0)
+    keepalive_expiry: float = Field(default=60.0, ge=0)
+    http2: bool = False
+    # Open a connection in the background while the interactive prompt
+    # waits for input, so the first turn doesn't pay for the handshake
+    prewarm: bool = True
+    prewarm_timeout: float = Field(default=10.0, gt=0)
+    # Client-side quota shared by every session in the process that uses the
+    # same endpoint and key; requests queue in arrival order instead of
+    # being rejected with 429s. Disabled when both are unset
+    requests_per_minute: int | None = Field(default=None, ge=1)
+    tokens_per_minute: int | None = Field(default=None, ge=1)
+
+
+class ToolsConfig(BaseModel):
+    # Default deadline for a single tool call; None disables it
+    timeout: float | None = Field(default=120.0, gt=0)
+    # Per-tool overrides keyed by tool name
+    timeouts: dict[str, float] = Field(default_factory=dict)
+
+    def get_timeout(
+        self, tool_name: str, tool_default: float | None = None
+    ) -> float | None:
+        if tool_name in self.timeouts:
+            return self.timeouts[tool_name]
+        if tool_default is not None:
+            return tool_default
+        return self.timeout
+
+
+class LoopDetectionConfig(BaseModel):
+    enabled: bool = True
+    window: int = Field(default=20, ge=2)
+    max_repeats: int = Field(default=3, ge=2)
+    max_cycle_length: int = Field(default=3, ge=2)
+    # Loop-breaker prompts injected per run before the run is stopped
+    max_interventions: int = Field(default=2, ge=0)
 
 
 class Config(BaseModel):
     model: ModelConfig = Field(default_factory=ModelConfig)
+    context: ContextConfig = Field(default_factory=ContextConfig)
+    loop_detection: LoopDetectionConfig = Field(default_factory=LoopDetectionConfig)
+    client: ClientConfig = Field(default_factory=ClientConfig)
+    tools: ToolsConfig = Field(default_factory=ToolsConfig)
     cwd: Path = Field(default_factory=Path.cwd)
 
     max_turns: int = 100
+    # Upper bound on read-only tool calls running at once within a turn
+    max_tool_concurrency: int = Field(default=4, ge=1)
 
     developer_instructions: str | None = None
     user_instructions: str | None = None
@@ -47,9 +167,20 @@ class Config(BaseModel):
     def validate(self) -> list[str]:
         errors: list[str] = []
 
-        if not self.api_key:
+        if not self.api_key and self.client.cassette_mode != "replay":
             errors.append("API_KEY environment variable is not set")
 
+        if self.client.cassette_mode != "off":
+            if self.client.cassette_path is None:
+                errors.append(
+                    f"client.cassette_path is required in {self.client.cassette_mode} mode"
+                )
+            elif (
+                self.client.cassette_mode == "replay"
+                and not self.client.cassette_path.is_file()
+            ):
+                errors.append(f"Cassette not found: {self.client.cassette_path}")
+
         if not self.cwd.exists():
             errors.append(f"Current working directory does not exist: {self.cwd}")
 
@@ -101,3 +101,11 @@ def load_config(cwd: Path | None) -> Config:
         ) from e
     
     return config
+
+
+def load_config_for_cwd(base: Config, cwd: Path) -> Config:
+    # Project config and agent.md come from the new cwd, but client settings
+    # (cassette, pool, rate limits) belong to the running process, which may
+    # have set them from the command line
+    config = load_config(cwd=cwd)
+    return config.model_copy(update={"client": base.client})
@@ -1,19 +1,71 @@
+import json
+import sys
 from dataclasses import dataclass, field
+from client.response import ToolResultMessage
 from config.config import Config
-from prompts.system import get_system_prompt
-from utils.text import count_tokens
+from context.spill import SpillFile, SpillRef
+from prompts.system import get_compression_prompt, get_system_prompt
+from utils.calibration import get_calibration
+from utils.text import (
+    content_digest,
+    count_tokens,
+    count_tokens_batch,
+    truncate_text,
+)
 from typing import Any
 
+SUMMARY_PREFIX = "[Summary of earlier conversation]\n\n"
+# After a failed compaction, the share of the context window the prompt must
+# grow by before compaction is attempted again
+COMPACTION_RETRY_GROWTH = 0.05
 
-@dataclass
+
+@dataclass(slots=True)
 class MessageItem:
     role: str
-    content: str
+    # Either the text itself or a reference into the session spill file
+    raw_content: str | SpillRef
     tool_call_id: str | None = None
     tool_calls: list[dict[str, Any]] = field(default_factory=list)
     token_count: int | None = None
+    tool_name: str | None = None
+    metadata: dict[str, Any] = field(default_factory=dict)
+    turn: int = 0
+    size: int = 0
+    evicted: bool = False
+    superseded: bool = False
+    _serialized: dict[str, Any] | None = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+    def __post_init__(self) -> None:
+        self.role = sys.intern(self.role)
+        if self.tool_name is not None:
+            self.tool_name = sys.intern(self.tool_name)
+
+    @property
+    def content(self) -> str:
+        if isinstance(self.raw_content, SpillRef):
+            return self.raw_content.load()
+        return self.raw_content
+
+    @content.setter
+    def content(self, value: str) -> None:
+        self.raw_content = value
+        self._serialized = None
+
+    @property
+    def is_spilled(self) -> bool:
+        return isinstance(self.raw_content, SpillRef)
+
+    def invalidate(self) -> None:
+        self._serialized = None
 
     def to_dict(self) -> dict[str, Any]:
+        # Cached: callers must treat the returned dict as read-only
+        if self._serialized is not None:
+            return self._serialized
+
         result: dict[str, Any] = {"role": self.role}
 
         if self.tool_call_id:
@@ -22,9 +74,13 @@ class MessageItem:
         if self.tool_calls:
             result["tool_calls"] = self.tool_calls
 
-        if self.content:
-            result["content"] = self.content
+        content = self.content
+        if content:
+            result["content"] = content
 
+        # Spilled contents are loaded per request and never kept resident
+        if not self.is_spilled:
+            self._serialized = result
         return result
 
 
@@ -32,15 +88,62 @@ class ContextManager:
     def __init__(self, config: Config) -> None:
         self._system_prompt = get_system_prompt(config)
         self._model_name = config.model_name
+        self._system_prompt_tokens = count_tokens(
+            self._system_prompt or "", self._model_name
+        )
         self._messages: list[MessageItem] = []
+        self._message_tokens = 0
+        # Serialized form of self._messages[:len(self._serialized)]; only the
+        # suffix past that point is rebuilt by get_messages. Spilled items
+        # hold a None placeholder and are loaded at request time.
+        self._serialized: list[dict[str, Any] | None] = []
+        self._spilled_positions: list[int] = []
+        self._system_message: dict[str, Any] | None = (
+            {"role": "system", "content": self._system_prompt}
+            if self._system_prompt
+            else None
+        )
+
+        self._context_window = config.model.context_window
+        self._compaction_threshold = config.context.compaction_threshold
+        self._keep_recent_turns = config.context.keep_recent_turns
+        self._compaction_input_tokens = config.context.compaction_input_tokens
+        self._compaction_failed_at: int | None = None
+
+        self._turn = 0
+        self._tool_output_max_age = config.context.tool_output_max_age_turns
+        self._tool_output_budget = config.context.tool_output_budget_bytes
+        self._tool_output_min_evict = config.context.tool_output_min_evict_bytes
+        self._evict_superseded = config.context.evict_superseded_outputs
+        self._eviction_interval = config.context.eviction_interval_turns
+        self._last_eviction_turn = 0
+
+        self._dedupe_min_bytes = config.context.dedupe_min_bytes
+        self._dedupe_index: dict[tuple[Any, ...], MessageItem] = {}
+        # Reference items by the tool_call_id of the result holding their content
+        self._references: dict[str, list[MessageItem]] = {}
+
+        self._spill = SpillFile(config.context.spill_dir)
+        self._spill_threshold = config.context.spill_threshold_bytes
+
+    def _append(self, item: MessageItem) -> None:
+        item.turn = self._turn
+        content = item.raw_content
+        if isinstance(content, str):
+            if not item.size:
+                item.size = len(content.encode("utf-8", errors="replace"))
+            if self._spill_threshold and item.size >= self._spill_threshold:
+                item.raw_content = self._spill.write(content)
+        self._messages.append(item)
+        self._message_tokens += item.token_count or 0
 
     def add_user_message(self, content: str) -> None:
         item = MessageItem(
             role="user",
-            content=content,
+            raw_content=content,
             token_count=count_tokens(content, self._model_name),
         )
-        self._messages.append(item)
+        self._append(item)
 
     def add_assistant_message(
         self,
@@ -49,31 +152,392 @@ class ContextManager:
     ) -> None:
         item = MessageItem(
             role="assistant",
-            content=content or "",
+            raw_content=content or "",
             token_count=count_tokens(
                 content or "",
                 self._model_name,
+            )
+            + (
+                count_tokens(json.dumps(tool_calls), self._model_name)
+                if tool_calls
+                else 0
             ),
             tool_calls=tool_calls or [],
         )
-        self._messages.append(item)
+        self._turn += 1
+        self._append(item)
 
-    def add_tool_result(self, tool_call_id: str, content: str) -> None:
-        item = MessageItem(
-            role="tool",
-            content=content,
-            tool_call_id=tool_call_id,
-            token_count=count_tokens(content, self._model_name),
+    def add_tool_result(
+        self,
+        tool_call_id: str,
+        content: str,
+        tool_name: str | None = None,
+        metadata: dict[str, Any] | None = None,
+        is_mutating: bool = False,
+    ) -> None:
+        self.add_tool_results(
+            [
+                ToolResultMessage(
+                    tool_call_id=tool_call_id,
+                    content=content,
+                    tool_name=tool_name,
+                    metadata=metadata or {},
+                    is_mutating=is_mutating,
+                )
+            ]
         )
-        self._messages.append(item)
 
-    def get_messages(self) -> list[dict[str, Any]]:
+    def add_tool_results(self, results: list[ToolResultMessage]) -> None:
+        contents: list[str] = []
+        dedupe_keys: list[list[tuple[Any, ...]]] = []
+        originals: list[str | None] = []
+        batch_index: dict[tuple[Any, ...], ToolResultMessage] = {}
+
+        for result in results:
+            keys = self._get_dedupe_keys(result)
+            original = self._find_original(result, keys, batch_index)
+            if original is not None:
+                contents.append(_make_reference(result, original))
+                dedupe_keys.append([])
+                originals.append(original.tool_call_id)
+                continue
+
+            contents.append(result.content)
+            dedupe_keys.append(keys)
+            originals.append(None)
+            for key in keys:
+                batch_index.setdefault(key, result)
+
+        token_counts = count_tokens_batch(contents, self._model_name)
+        for result, content, keys, original_id, token_count in zip(
+            results, contents, dedupe_keys, originals, token_counts
+        ):
+            item = MessageItem(
+                role="tool",
+                raw_content=content,
+                tool_call_id=result.tool_call_id,
+                token_count=token_count,
+                tool_name=result.tool_name,
+                metadata=result.metadata,
+                size=len(content.encode("utf-8", errors="replace")),
+            )
+            self._append(item)
+            for key in keys:
+                self._dedupe_index[key] = item
+            if original_id is not None:
+                self._references.setdefault(original_id, []).append(item)
+
+            self._mark_superseded(result, before=len(self._messages) - 1)
+
+    def _get_dedupe_keys(self, result: ToolResultMessage) -> list[tuple[Any, ...]]:
+        if result.is_error:
+            return []
+        if len(result.content) < self._dedupe_min_bytes:
+            return []
+
+        keys: list[tuple[Any, ...]] = []
+        metadata = result.metadata
+        if metadata.get("path") and metadata.get("mtime_ns") is not None:
+            keys.append(
+                (
+                    "range",
+                    result.tool_name,
+                    metadata["path"],
+                    metadata["mtime_ns"],
+                    metadata.get("shown_start"),
+                    metadata.get("shown_end"),
+                )
+            )
+        keys.append(("content", content_digest(result.content)))
+        return keys
+
+    def _find_original(
+        self,
+        result: ToolResultMessage,
+        keys: list[tuple[Any, ...]],
+        batch_index: dict[tuple[Any, ...], ToolResultMessage],
+    ) -> MessageItem | ToolResultMessage | None:
+        # An original this result is about to supersede would be stubbed
+        # right away, so it can't be referenced
+        for key in keys:
+            item = self._dedupe_index.get(key)
+            if (
+                item is not None
+                and not item.evicted
+                and not item.superseded
+                and not self._supersedes(result, item)
+            ):
+                return item
+
+            pending = batch_index.get(key)
+            if pending is not None and not self._supersedes(result, pending):
+                return pending
+
+        return None
+
+    def _supersedes(
+        self,
+        result: ToolResultMessage,
+        item: MessageItem | ToolResultMessage,
+    ) -> bool:
+        if not self._evict_superseded or result.is_error:
+            return False
+
+        path = result.metadata.get("path")
+        if (
+            not isinstance(path, str)
+            or item.tool_name != "read_file"
+            or item.metadata.get("path") != path
+        ):
+            return False
+
+        if result.is_mutating:
+            return True
+        # A read of a newer version of the file supersedes earlier reads
+        mtime_ns = result.metadata.get("mtime_ns")
+        return mtime_ns is not None and item.metadata.get("mtime_ns") != mtime_ns
+
+    def _mark_superseded(self, result: ToolResultMessage, before: int) -> None:
+        for idx in range(before):
+            item = self._messages[idx]
+            if item.role == "tool" and not item.evicted and self._supersedes(result, item):
+                item.superseded = True
+
+    def _evict(self, index: int, reason: str) -> None:
+        item = self._messages[index]
+        self._promote_reference(item)
+        stub = _make_stub(item, reason)
+        token_count = count_tokens(stub, self._model_name)
+
+        self._message_tokens += token_count - (item.token_count or 0)
+        item.content = stub
+        item.token_count = token_count
+        item.size = len(stub)
+        item.evicted = True
+        item.invalidate()
+        self._invalidate_from(index)
+
+    def _promote_reference(self, original: MessageItem) -> None:
+        # The original is leaving the context: move its content into its
+        # newest live reference and point the remaining references there.
+        # Callers invalidate serialization from the original onwards.
+        references = self._references.pop(original.tool_call_id, None)
+        if not references:
+            return
+
+        live = [ref for ref in references if not ref.evicted and not ref.superseded]
+        if not live:
+            return
+
+        holder = live.pop()
+        self._message_tokens += (original.token_count or 0) - (holder.token_count or 0)
+        holder.raw_content = original.raw_content
+        holder.token_count = original.token_count
+        holder.size = original.size
+        holder.invalidate()
+
+        for ref in live:
+            content = _make_reference(ref, holder, later=True)
+            token_count = count_tokens(content, self._model_name)
+            self._message_tokens += token_count - (ref.token_count or 0)
+            ref.content = content
+            ref.token_count = token_count
+            ref.size = len(content)
+        if live:
+            self._references[holder.tool_call_id] = live
+
+        for key, item in self._dedupe_index.items():
+            if item is original:
+                self._dedupe_index[key] = holder
+
+    def _live_tool_bytes(self) -> int:
+        return sum(
+            item.size
+            for item in self._messages
+            if item.role == "tool" and not item.evicted
+        )
+
+    def evict_stale_tool_outputs(self) -> int:
+        over_budget = self._live_tool_bytes() > self._tool_output_budget
+        if (
+            not over_budget
+            and self._turn - self._last_eviction_turn < self._eviction_interval
+        ):
+            return 0
+        self._last_eviction_turn = self._turn
+
+        evicted = 0
+        live_bytes = 0
+        # Walk newest to oldest so the byte budget keeps the most recent outputs
+        for idx in range(len(self._messages) - 1, -1, -1):
+            item = self._messages[idx]
+            if item.role != "tool" or item.evicted:
+                continue
+            if item.superseded:
+                self._evict(idx, "the file has changed since")
+                evicted += 1
+                continue
+            if item.size < self._tool_output_min_evict:
+                continue
+
+            age = self._turn - item.turn
+            if age >= self._tool_output_max_age:
+                self._evict(idx, f"older than {self._tool_output_max_age} turns")
+                evicted += 1
+            elif live_bytes + item.size > self._tool_output_budget:
+                self._evict(idx, "tool output budget exceeded")
+                evicted += 1
+            else:
+                live_bytes += item.size
+
+        return evicted
+
+    def get_token_count(self) -> int:
+        return self._system_prompt_tokens + self._message_tokens
+
+    def estimated_prompt_tokens(self) -> int:
+        return get_calibration(self._model_name).to_provider_tokens(
+            self.get_token_count()
+        )
+
+    def needs_compaction(self) -> bool:
+        budget = self._context_window * self._compaction_threshold
+        if self._compaction_failed_at is not None:
+            # Don't retry a doomed summary every turn
+            budget = max(
+                budget,
+                self._compaction_failed_at
+                + self._context_window * COMPACTION_RETRY_GROWTH,
+            )
+        return self.estimated_prompt_tokens() >= budget
+
+    def record_compaction_failure(self) -> None:
+        self._compaction_failed_at = self.estimated_prompt_tokens()
+
+    def get_compaction_split(self) -> int | None:
+        # Keep the last N assistant turns (with their tool results) verbatim;
+        # everything before the oldest kept assistant message gets summarized
+        assistant_indices = [
+            idx for idx, item in enumerate(self._messages) if item.role == "assistant"
+        ]
+        if len(assistant_indices) <= self._keep_recent_turns:
+            return None
+
+        split = assistant_indices[-self._keep_recent_turns]
+        return split if split > 0 else None
+
+    def get_compaction_messages(self, split: int) -> list[dict[str, Any]]:
         messages = []
 
         if self._system_prompt:
             messages.append({"role": "system", "content": self._system_prompt})
 
-        for item in self._messages:
-            messages.append(item.to_dict())
+        for item in self._messages[:split]:
+            message = dict(item.to_dict())
+            if item.role == "tool" and item.content:
+                message["content"] = truncate_text(
+                    item.content,
+                    self._model_name,
+                    self._compaction_input_tokens,
+                    tail_tokens=self._compaction_input_tokens // 4,
+                )
+            messages.append(message)
 
+        messages.append({"role": "user", "content": get_compression_prompt()})
         return messages
+
+    def apply_compaction(self, summary: str, split: int) -> None:
+        content = SUMMARY_PREFIX + summary
+        item = MessageItem(
+            role="user",
+            raw_content=content,
+            token_count=count_tokens(content, self._model_name),
+        )
+        for message in self._messages[:split]:
+            if message.role == "tool" and not message.evicted:
+                self._promote_reference(message)
+
+        self._messages[:split] = [item]
+        self._message_tokens = sum(
+            message.token_count or 0 for message in self._messages
+        )
+        self._dedupe_index.clear()
+        kept = {id(message): message.tool_call_id for message in self._messages}
+        kept_call_ids = set(kept.values())
+        references = {}
+        for call_id, refs in self._references.items():
+            refs = [ref for ref in refs if id(ref) in kept]
+            if refs and call_id in kept_call_ids:
+                references[call_id] = refs
+        self._references = references
+        self._compaction_failed_at = None
+        self._invalidate_from(0)
+
+    def _invalidate_from(self, index: int) -> None:
+        del self._serialized[index:]
+        while self._spilled_positions and self._spilled_positions[-1] >= index:
+            self._spilled_positions.pop()
+
+    def get_messages(self) -> list[dict[str, Any]]:
+        for idx in range(len(self._serialized), len(self._messages)):
+            item = self._messages[idx]
+            if item.is_spilled:
+                self._spilled_positions.append(idx)
+                self._serialized.append(None)
+            else:
+                self._serialized.append(item.to_dict())
+
+        offset = 0
+        messages: list[dict[str, Any]] = []
+        if self._system_message is not None:
+            messages.append(self._system_message)
+            offset = 1
+        messages.extend(self._serialized)
+
+        for idx in self._spilled_positions:
+            messages[idx + offset] = self._messages[idx].to_dict()
+
+        return messages
+
+    def close(self) -> None:
+        self._spill.close()
+
+
+def _make_stub(item: MessageItem, reason: str) -> str:
+    name = item.tool_name or "tool"
+    path = item.metadata.get("path")
+    if not isinstance(path, str):
+        return (
+            f"[{name} output ({item.size} bytes) removed from context: {reason}. "
+            "Re-run the tool if needed.]"
+        )
+
+    location = path
+    start = item.metadata.get("shown_start")
+    end = item.metadata.get("shown_end")
+    if start and end:
+        location = f"{path}, lines {start}-{end}"
+
+    return (
+        f"[{name} output for {location} removed from context: {reason}. "
+        "Re-read if needed.]"
+    )
+
+
+def _make_reference(
+    result: MessageItem | ToolResultMessage,
+    original: MessageItem | ToolResultMessage,
+    later: bool = False,
+) -> str:
+    name = result.tool_name or "tool"
+    location = ""
+    path = result.metadata.get("path")
+    if isinstance(path, str):
+        location = f" for {path}"
+
+    return (
+        f"[{name} output{location} is identical to the "
+        f"{'later' if later else 'earlier'} "
+        f"{original.tool_name or 'tool'} result {original.tool_call_id}; "
+        f"refer to that result {'below' if later else 'above'}.]"
+    )
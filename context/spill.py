@@ -0,0 +1,81 @@
+from __future__ import annotations
+import mmap
+import tempfile
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+
+
+@dataclass(slots=True, frozen=True)
+class SpillRef:
+    store: SpillFile
+    offset: int
+    length: int
+
+    def load(self) -> str:
+        return self.store.read(self.offset, self.length)
+
+
+class SpillFile:
+    def __init__(self, directory: Path | None = None) -> None:
+        self._directory = directory
+        self._file = None
+        self._mmap: mmap.mmap | None = None
+        self._size = 0
+        self._mapped_size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def write(self, text: str) -> SpillRef:
+        data = text.encode("utf-8", errors="surrogatepass")
+
+        with self._lock:
+            if self._file is None:
+                self._file = tempfile.TemporaryFile(
+                    prefix="ai-agent-spill-",
+                    dir=self._directory,
+                )
+
+            offset = self._size
+            self._file.seek(offset)
+            self._file.write(data)
+            self._size += len(data)
+
+        return SpillRef(store=self, offset=offset, length=len(data))
+
+    def read(self, offset: int, length: int) -> str:
+        if length == 0:
+            return ""
+
+        with self._lock:
+            if self._file is None:
+                raise ValueError("Spill file is closed")
+
+            if self._mmap is None or offset + length > self._mapped_size:
+                # Remap lazily to cover everything written so far; pages are
+                # served from the OS page cache rather than the Python heap
+                self._file.flush()
+                if self._mmap is not None:
+                    self._mmap.close()
+                self._mmap = mmap.mmap(
+                    self._file.fileno(), self._size, access=mmap.ACCESS_READ
+                )
+                self._mapped_size = self._size
+
+            data = self._mmap[offset : offset + length]
+
+        return data.decode("utf-8", errors="surrogatepass")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._size = 0
+            self._mapped_size = 0
@@ -0,0 +1,127 @@
+# Thin client for the agent daemon. Only the standard library is imported
+# here, so a scripted invocation costs little more than interpreter startup.
+import argparse
+import json
+import os
+import socket
+import struct
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Iterator
+
+SOCKET_ENV_VAR = "AI_AGENT_SOCKET"
+
+
+def get_default_socket_dir() -> Path:
+    # A per-user directory the daemon creates with mode 0700, so no other
+    # user can bind the socket before it does
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return Path(runtime_dir) / "ai-agent"
+    return Path(tempfile.gettempdir()) / f"ai-agent-{os.getuid()}"
+
+
+def get_default_socket_path() -> Path:
+    path = os.environ.get(SOCKET_ENV_VAR)
+    if path:
+        return Path(path)
+    return get_default_socket_dir() / "daemon.sock"
+
+
+def check_peer_owner(sock: socket.socket, socket_path: Path) -> None:
+    # Refuse to send prompts to a socket some other user is listening on
+    if hasattr(socket, "SO_PEERCRED"):
+        credentials = sock.getsockopt(
+            socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+        )
+        _, uid, _ = struct.unpack("3i", credentials)
+    else:
+        uid = os.stat(socket_path).st_uid
+    if uid != os.getuid():
+        raise PermissionError(f"{socket_path} is owned by another user (uid {uid})")
+
+
+def stream_events(
+    prompt: str,
+    cwd: Path,
+    socket_path: Path,
+) -> Iterator[dict[str, Any]]:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(str(socket_path))
+        check_peer_owner(sock, socket_path)
+        request = {"prompt": prompt, "cwd": str(cwd)}
+        try:
+            sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        except BrokenPipeError:
+            # The daemon rejected the request before reading all of it; its
+            # error reply is still waiting to be read
+            pass
+
+        # The write side stays open: the daemon treats EOF from the client
+        # as a cancellation of the run
+        with sock.makefile("r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Run a prompt on the agent daemon")
+    parser.add_argument("prompt")
+    parser.add_argument("-c", "--cwd", type=Path, default=Path.cwd())
+    parser.add_argument("--socket", type=Path, default=get_default_socket_path())
+    parser.add_argument(
+        "-o",
+        "--output",
+        choices=["text", "ndjson"],
+        default="text",
+    )
+    args = parser.parse_args(argv)
+
+    failed = False
+    response: str | None = None
+    try:
+        for event in stream_events(args.prompt, args.cwd.resolve(), args.socket):
+            event_type = event.get("type")
+            data = event.get("data", {})
+
+            if args.output == "ndjson":
+                sys.stdout.write(json.dumps(event) + "\n")
+                sys.stdout.flush()
+            elif event_type == "text_delta":
+                sys.stdout.write(data.get("content", ""))
+                sys.stdout.flush()
+            elif event_type == "text_complete":
+                sys.stdout.write("\n")
+            elif event_type == "stream_reset":
+                print("\n[connection lost, regenerating response]", file=sys.stderr)
+            elif event_type == "tool_call_start":
+                print(f"[tool] {data.get('name')}", file=sys.stderr)
+            elif event_type == "agent_error":
+                print(f"Error: {data.get('error')}", file=sys.stderr)
+
+            if event_type == "agent_error":
+                failed = True
+            elif event_type == "agent_end":
+                response = data.get("response")
+    except (FileNotFoundError, ConnectionRefusedError):
+        print(
+            f"No agent daemon listening on {args.socket} (start one with --serve)",
+            file=sys.stderr,
+        )
+        return 2
+    except ConnectionError as e:
+        print(f"Lost connection to the agent daemon: {e}", file=sys.stderr)
+        return 2
+    except PermissionError as e:
+        print(f"Refusing to use {args.socket}: {e}", file=sys.stderr)
+        return 2
+    except KeyboardInterrupt:
+        return 130
+
+    return 1 if failed or response is None else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
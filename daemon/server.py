@@ -0,0 +1,186 @@
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import os
+import socket
+import stat
+from pathlib import Path
+from typing import Any
+
+from openai import AsyncOpenAI
+
+from agent.agent import Agent
+from agent.events import AgentEvent
+from client.llm_client import create_openai_client
+from config.config import Config
+from config.loader import load_config_for_cwd
+from daemon.client import get_default_socket_dir, get_default_socket_path
+from tools.registry import create_default_registry
+from utils.text import get_encoding
+
+logger = logging.getLogger(__name__)
+
+# Longest request line accepted from a client; prompts can be large
+MAX_REQUEST_BYTES = 16 * 1024 * 1024
+
+
+class AgentDaemon:
+    def __init__(self, config: Config, socket_path: Path | None = None) -> None:
+        self.config = config
+        self.socket_path = socket_path or get_default_socket_path()
+        self._client: AsyncOpenAI | None = None
+        self._server: asyncio.Server | None = None
+
+    def prewarm(self) -> None:
+        # Pay for tokenizer loading and schema generation once, up front,
+        # instead of on the first request
+        get_encoding(self.config.model_name)
+        create_default_registry().get_schemas()
+        self._client = create_openai_client(self.config)
+
+    async def serve_forever(self) -> None:
+        self._prepare_socket_dir()
+        self._remove_stale_socket()
+        self.prewarm()
+
+        # Bind under a restrictive umask so the socket is never reachable by
+        # other users, not even between bind and a later chmod
+        umask = os.umask(0o177)
+        try:
+            self._server = await asyncio.start_unix_server(
+                self._handle_connection,
+                path=str(self.socket_path),
+                limit=MAX_REQUEST_BYTES,
+            )
+        finally:
+            os.umask(umask)
+        logger.info(f"Agent daemon listening on {self.socket_path}")
+
+        try:
+            async with self._server:
+                await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+        self.socket_path.unlink(missing_ok=True)
+
+    def _prepare_socket_dir(self) -> None:
+        directory = self.socket_path.parent
+        if directory != get_default_socket_dir():
+            # An explicitly chosen location is the caller's responsibility
+            directory.mkdir(parents=True, exist_ok=True)
+            return
+
+        directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+        st = directory.lstat()
+        if (
+            not stat.S_ISDIR(st.st_mode)
+            or st.st_uid != os.getuid()
+            or stat.S_IMODE(st.st_mode) & 0o077
+        ):
+            raise RuntimeError(
+                f"Refusing to use {directory}: it must be a directory owned by "
+                "the current user and accessible only to them (mode 0700)"
+            )
+
+    def _remove_stale_socket(self) -> None:
+        if not self.socket_path.exists():
+            return
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(str(self.socket_path))
+            except (ConnectionRefusedError, FileNotFoundError):
+                self.socket_path.unlink(missing_ok=True)
+                return
+
+        raise RuntimeError(f"Another agent daemon is listening on {self.socket_path}")
+
+    async def _handle_connection(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        try:
+            try:
+                line = await reader.readline()
+            except (ValueError, asyncio.LimitOverrunError):
+                await self._write_event(
+                    writer,
+                    AgentEvent.agent_error(
+                        f"Invalid request: longer than {MAX_REQUEST_BYTES} bytes"
+                    ),
+                )
+                return
+
+            try:
+                request = json.loads(line)
+                prompt = request["prompt"]
+                if not isinstance(prompt, str) or not prompt.strip():
+                    raise ValueError("empty prompt")
+            except (ValueError, KeyError, TypeError) as e:
+                await self._write_event(
+                    writer, AgentEvent.agent_error(f"Invalid request: {e}")
+                )
+                return
+
+            run = asyncio.create_task(self._run(request, writer))
+            # The client keeps its end open for the whole run, so EOF means it
+            # went away and the run should be cancelled
+            disconnected = asyncio.create_task(reader.read())
+            try:
+                await asyncio.wait(
+                    {run, disconnected},
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+            finally:
+                disconnected.cancel()
+                if not run.done():
+                    run.cancel()
+                await asyncio.gather(run, return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _run(self, request: dict[str, Any], writer: asyncio.StreamWriter) -> None:
+        try:
+            config = self._get_request_config(request)
+            errors = config.validate()
+        except Exception as e:
+            errors = [str(e)]
+
+        if errors:
+            for error in errors:
+                await self._write_event(writer, AgentEvent.agent_error(error))
+            return
+
+        async with Agent(config, client=self._client) as agent:
+            async for event in agent.run(request["prompt"]):
+                await self._write_event(writer, event)
+
+    def _get_request_config(self, request: dict[str, Any]) -> Config:
+        cwd = request.get("cwd")
+        if not cwd or Path(cwd).resolve() == self.config.cwd.resolve():
+            return self.config
+        return load_config_for_cwd(self.config, Path(cwd).resolve())
+
+    async def _write_event(
+        self,
+        writer: asyncio.StreamWriter,
+        event: AgentEvent,
+    ) -> None:
+        writer.write(json.dumps(event.to_dict(), default=str).encode("utf-8") + b"\n")
+        await writer.drain()
@@ -1,27 +1,33 @@
 import asyncio
+import json
 from pathlib import Path
+import signal
 import sys
 import click
 
 from agent.agent import Agent
+from agent.batch import BatchRunner, load_batch_tasks
 from agent.events import AgentEventType
 from config.config import Config
 from config.loader import load_config
+from daemon.server import AgentDaemon
 from ui.tui import TUI, get_console
 
 console = get_console()
 
 
 class CLI:
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, output: str = "text"):
         self.agent: Agent | None = None
         self.config = config
-        self.tui = TUI(config, console)
+        self.output = output
+        # NDJSON output bypasses rich rendering entirely
+        self.tui = TUI(config, console) if output == "text" else None
 
     async def run_single(self, message: str) -> str | None:
         async with Agent(self.config) as agent:
             self.agent = agent
-            return await self._process_message(message)
+            return await self._run_cancellable(message)
 
     async def run_interactive(self) -> str | None:
         self.tui.print_welcome(
@@ -35,10 +41,13 @@ class CLI:
 
         async with Agent(self.config) as agent:
             self.agent = agent
+            prewarm = None
+            if self.config.client.prewarm:
+                prewarm = asyncio.create_task(agent.session.client.prewarm())
 
             while True:
                 try:
-                    user_input = console.input("\n[user]>[/user] ").strip()
+                    user_input = (await self._read_input("\n[user]>[/user] ")).strip()
                     if not user_input:
                         continue
 
@@ -48,14 +57,65 @@ class CLI:
                     #         break
                     #     continue
 
-                    await self._process_message(user_input)
+                    await self._run_cancellable(user_input)
                 except KeyboardInterrupt:
                     console.print("\n[dim]Use /exit to quit[/dim]")
                 except EOFError:
                     break
 
+            if prewarm is not None:
+                prewarm.cancel()
+
         console.print("\n[dim]Goodbye![/dim]")
 
+    async def _read_input(self, prompt: str) -> str:
+        # Input is read on a worker thread so the event loop stays free for
+        # background work such as the connection pre-warm
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(
+                signal.SIGINT,
+                lambda: console.print("\n[dim]Use /exit to quit[/dim]"),
+            )
+        except (NotImplementedError, RuntimeError):
+            pass
+
+        try:
+            return await asyncio.to_thread(console.input, prompt)
+        finally:
+            try:
+                loop.remove_signal_handler(signal.SIGINT)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+    async def _run_cancellable(self, message: str) -> str | None:
+        # Ctrl-C cancels the in-flight turn (closing the model stream and any
+        # running tools) instead of tearing down the whole session
+        loop = asyncio.get_running_loop()
+        task = asyncio.create_task(self._process_message(message))
+        try:
+            loop.add_signal_handler(signal.SIGINT, task.cancel)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+        try:
+            return await task
+        except asyncio.CancelledError:
+            current = asyncio.current_task()
+            if current is not None and current.cancelling():
+                raise
+            if self.tui is None:
+                self._write_json({"type": "cancelled", "data": {}})
+            else:
+                self.tui.end_assistant()
+                console.print("\n[warning]Interrupted[/warning]")
+            return None
+        finally:
+            try:
+                loop.remove_signal_handler(signal.SIGINT)
+            except (NotImplementedError, RuntimeError):
+                pass
+
     def _get_tool_kind(self, tool_name: str) -> str | None:
         tool_kind = None
         tool = self.agent.session.tool_registry.get(tool_name)
@@ -66,10 +126,27 @@ class CLI:
 
         return tool_kind
 
+    def _write_json(self, data: dict) -> None:
+        sys.stdout.write(json.dumps(data, default=str) + "\n")
+        sys.stdout.flush()
+
+    async def _process_message_ndjson(self, message: str) -> str | None:
+        final_response: str | None = None
+
+        async for event in self.agent.run(message):
+            self._write_json(event.to_dict())
+            if event.type == AgentEventType.TEXT_COMPLETE:
+                final_response = event.data.get("content")
+
+        return final_response
+
     async def _process_message(self, message: str) -> str | None:
         if not self.agent:
             return None
 
+        if self.tui is None:
+            return await self._process_message_ndjson(message)
+
         assistant_streaming = False
         final_response: str | None = None
 
@@ -85,6 +162,11 @@ class CLI:
                 if assistant_streaming:
                     self.tui.end_assistant()
                     assistant_streaming = False
+            elif event.type == AgentEventType.STREAM_RESET:
+                if assistant_streaming:
+                    self.tui.end_assistant()
+                    assistant_streaming = False
+                console.print("[dim]Connection lost, regenerating response...[/dim]")
             elif event.type == AgentEventType.AGENT_ERROR:
                 error = event.data.get("error", "Unknown error")
                 console.print(f"\n[error]Error: {error}[/error]")
@@ -130,14 +212,84 @@ class CLI:
     type=click.Path(exists=True, file_okay=False, path_type=Path),
     help="Current Working directory",
 )
+@click.option(
+    "--batch",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    help="Run every task in a JSONL file ({\"id\", \"prompt\", \"cwd\"} per line)",
+)
+@click.option(
+    "--concurrency",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+    help="Number of batch tasks to run at once",
+)
+@click.option(
+    "--batch-output",
+    type=click.File("w", encoding="utf-8"),
+    default="-",
+    help="JSONL file to write batch results to (default: stdout)",
+)
+@click.option(
+    "--output",
+    "-o",
+    type=click.Choice(["text", "ndjson"]),
+    default="text",
+    show_default=True,
+    help="Render output for a terminal, or write one JSON event per line",
+)
+@click.option(
+    "--serve",
+    is_flag=True,
+    help="Run as a daemon serving prompts over a Unix socket (see daemon/client.py)",
+)
+@click.option(
+    "--socket",
+    "socket_path",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="Unix socket path for --serve (default: $AI_AGENT_SOCKET or a per-user temp path)",
+)
+@click.option(
+    "--record",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="Record every model request and response stream to a cassette file",
+)
+@click.option(
+    "--replay",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="Serve model responses from a recorded cassette instead of the provider",
+)
+@click.option(
+    "--replay-realtime",
+    is_flag=True,
+    help="Replay cassette streams with their recorded timing",
+)
 def main(
     prompt: str | None,
     cwd: Path | None,
+    batch: Path | None,
+    concurrency: int,
+    batch_output,
+    output: str,
+    serve: bool,
+    socket_path: Path | None,
+    record: Path | None,
+    replay: Path | None,
+    replay_realtime: bool,
 ):
     try:
         config = load_config(cwd=cwd)
     except Exception as e:
         console.print(f"[error]Error loading config: {e}[/error]")
+        sys.exit(1)
+
+    if record and replay:
+        console.print("[error]--record and --replay cannot be combined[/error]")
+        sys.exit(1)
+    if record or replay:
+        config.client.cassette_mode = "record" if record else "replay"
+        config.client.cassette_path = record or replay
+        config.client.cassette_realtime = replay_realtime
 
     errors = config.validate()
     
@@ -147,7 +299,39 @@ def main(
         
         sys.exit(1)
 
-    cli = CLI(config)
+    if serve:
+        daemon = AgentDaemon(config, socket_path)
+        try:
+            asyncio.run(daemon.serve_forever())
+        except KeyboardInterrupt:
+            pass
+        except RuntimeError as e:
+            console.print(f"[error]{e}[/error]")
+            sys.exit(1)
+        return
+
+    if batch:
+        try:
+            tasks = load_batch_tasks(batch)
+        except Exception as e:
+            console.print(f"[error]Error loading batch: {e}[/error]")
+            sys.exit(1)
+
+        runner = BatchRunner(config, concurrency=concurrency)
+        results = asyncio.run(runner.run(tasks, batch_output))
+        failed = sum(1 for result in results if not result.success)
+        click.echo(
+            f"{len(results) - failed}/{len(results)} tasks succeeded", err=True
+        )
+        if failed:
+            sys.exit(1)
+        return
+
+    if output == "ndjson" and not prompt:
+        console.print("[error]--output ndjson requires a prompt[/error]")
+        sys.exit(1)
+
+    cli = CLI(config, output=output)
     
     if prompt:
         result = asyncio.run(cli.run_single(prompt))
@@ -0,0 +1,85 @@
+from client.response import StreamEvent, StreamEventType, TextDelta, ToolCall
+from client.stream_resume import StreamResumer
+
+
+def text(content: str) -> StreamEvent:
+    return StreamEvent(type=StreamEventType.TEXT_DELTA, text_delta=TextDelta(content))
+
+
+def tool_call(call_id: str, path: str = "README.md") -> StreamEvent:
+    return StreamEvent(
+        type=StreamEventType.TOOL_CALL_COMPLETE,
+        tool_call=ToolCall(call_id=call_id, name="read_file", arguments={"path": path}),
+    )
+
+
+def complete() -> StreamEvent:
+    return StreamEvent(type=StreamEventType.MESSAGE_COMPLETE, finish_reason="stop")
+
+
+def run(resumer: StreamResumer, events: list[StreamEvent]) -> list[StreamEvent]:
+    resumer.begin_attempt()
+    return [out for event in events for out in resumer.filter(event)]
+
+
+def types(events: list[StreamEvent]) -> list[StreamEventType]:
+    return [event.type for event in events]
+
+
+def test_identical_retry_is_suppressed():
+    resumer = StreamResumer()
+    run(resumer, [text("Hello "), text("world")])
+
+    out = run(resumer, [text("Hello world"), complete()])
+
+    assert types(out) == [StreamEventType.MESSAGE_COMPLETE]
+
+
+def test_retry_continues_after_replayed_text():
+    resumer = StreamResumer()
+    run(resumer, [text("Hello ")])
+
+    out = run(resumer, [text("Hello wor"), text("ld"), complete()])
+
+    assert [event.text_delta.content for event in out[:-1]] == ["wor", "ld"]
+    assert out[-1].type == StreamEventType.MESSAGE_COMPLETE
+
+
+def test_first_tool_call_after_replayed_text_passes_through():
+    resumer = StreamResumer()
+    run(resumer, [text("I will "), text("read")])
+
+    out = run(resumer, [text("I will "), text("read"), tool_call("call_2"), complete()])
+
+    assert types(out) == [
+        StreamEventType.TOOL_CALL_COMPLETE,
+        StreamEventType.MESSAGE_COMPLETE,
+    ]
+    assert out[0].tool_call.call_id == "call_2"
+
+
+def test_new_tool_call_after_replayed_calls_passes_through():
+    resumer = StreamResumer()
+    run(resumer, [text("Reading"), tool_call("call_1", "a.py")])
+
+    out = run(
+        resumer,
+        [text("Reading"), tool_call("call_3", "a.py"), tool_call("call_4", "b.py")],
+    )
+
+    assert types(out) == [StreamEventType.TOOL_CALL_COMPLETE]
+    assert out[0].tool_call.call_id == "call_4"
+
+
+def test_divergent_retry_resets():
+    resumer = StreamResumer()
+    run(resumer, [text("I will read")])
+
+    out = run(resumer, [text("Let me"), complete()])
+
+    assert types(out) == [
+        StreamEventType.STREAM_RESET,
+        StreamEventType.TEXT_DELTA,
+        StreamEventType.MESSAGE_COMPLETE,
+    ]
+    assert out[1].text_delta.content == "Let me"
@@ -7,6 +7,8 @@ from pydantic import BaseModel, ValidationError
 from dataclasses import dataclass, field
 from pydantic.json_schema import model_json_schema
 
+from client.response import to_openai_tool
+
 
 @dataclass
 class ToolInvocation:
@@ -90,6 +92,11 @@ class Tool(abc.ABC):
     name: str = "base_tool"
     description: str = "base tool"
     kind: ToolKind = ToolKind.READ
+    # Idempotent, non-mutating tools can opt in to ToolRegistry's result
+    # cache; entries are validated against get_cache_paths
+    cacheable: bool = False
+    # Default deadline for one call; the registry caller may override it
+    timeout: float | None = None
 
     def __init__(self) -> None:
         pass
@@ -119,6 +126,9 @@ class Tool(abc.ABC):
 
         return []
 
+    def get_cache_paths(self, invocation: ToolInvocation) -> list[Path]:
+        return []
+
     def is_mutating(self, params: dict[str, Any]) -> bool:
         return self.kind in {
             ToolKind.WRITE,
@@ -167,3 +177,6 @@ class Tool(abc.ABC):
         raise ValueError(
             f"Unsupported schema type for tool {self.name}: {type(schema)}"
         )
+
+    def to_openai_tool(self) -> dict[str, Any]:
+        return to_openai_tool(self.to_openai_schema())
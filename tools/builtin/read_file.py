@@ -1,8 +1,10 @@
+import asyncio
+from pathlib import Path
 from pydantic import BaseModel, Field
 
 from tools.base import Tool, ToolKind, ToolInvocation, ToolResult
 from utils.paths import is_binary_file, resolve_path
-from utils.text import count_tokens, truncate_text
+from utils.text import truncate_text
 
 
 class ReadFileParameters(BaseModel):
@@ -31,11 +33,22 @@ class ReadFileTool(Tool):
     )
     kind = ToolKind.READ
     schema = ReadFileParameters
+    cacheable = True
 
     MAX_FILE_SIZE = 1024 * 1024 * 10
     MAX_OUTPUT_TOKENS = 25000
+    MAX_OUTPUT_TAIL_TOKENS = 5000
+    TOKENIZER_MODEL = "gpt-4"
+
+    def get_cache_paths(self, invocation: ToolInvocation) -> list[Path]:
+        return [resolve_path(invocation.cwd, invocation.params["path"])]
 
     async def execute(self, invocation: ToolInvocation) -> ToolResult:
+        # File I/O and tokenizing block; run them off the event loop so
+        # concurrent calls overlap and a deadline can abandon a slow one
+        return await asyncio.to_thread(self._read, invocation)
+
+    def _read(self, invocation: ToolInvocation) -> ToolResult:
         params = ReadFileParameters(**invocation.params)
         path = resolve_path(invocation.cwd, params.path)
 
@@ -45,7 +58,8 @@ class ReadFileTool(Tool):
         if not path.is_file():
             return ToolResult.error_result(f"Path is not a file: {path}")
 
-        file_size = path.stat().st_size
+        stat = path.stat()
+        file_size = stat.st_size
 
         if file_size > self.MAX_FILE_SIZE:
             return ToolResult.error_result(
@@ -91,16 +105,6 @@ class ReadFileTool(Tool):
 
             output = "\n".join(formatted_lines)
 
-            token_count = count_tokens(output)
-            truncated = False
-            if token_count > self.MAX_OUTPUT_TOKENS:
-                output = truncate_text(
-                    output,
-                    self.MAX_OUTPUT_TOKENS,
-                    suffix=f"\n... [truncated {total_lines} total lines]",
-                )
-                truncated = True
-
             metadata_lines = []
             if start_idx > 0 or end_idx < total_lines:
                 metadata_lines.append(
@@ -110,6 +114,18 @@ class ReadFileTool(Tool):
                 header = " | ".join(metadata_lines) + "\n\n"
                 output = header + output
 
+            # Truncate the final output so its token count lands in the shared
+            # cache under the same content the context manager will count
+            truncated_output = truncate_text(
+                output,
+                self.TOKENIZER_MODEL,
+                self.MAX_OUTPUT_TOKENS,
+                suffix=f"\n... [truncated {total_lines} total lines]",
+                tail_tokens=self.MAX_OUTPUT_TAIL_TOKENS,
+            )
+            truncated = truncated_output is not output
+            output = truncated_output
+
             return ToolResult.success_result(
                 output=output,
                 truncated=truncated,
@@ -118,6 +134,7 @@ class ReadFileTool(Tool):
                     "total_lines": total_lines,
                     "shown_start": start_idx + 1,
                     "shown_end": end_idx,
+                    "mtime_ns": stat.st_mtime_ns,
                 },
             )
         except Exception as e:
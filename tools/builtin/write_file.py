@@ -1,3 +1,4 @@
+import asyncio
 from pydantic import BaseModel, Field
 from tools.base import Tool, ToolKind, ToolInvocation, ToolResult, FileDiff
 from utils.paths import ensure_parent_directory, resolve_path
@@ -26,6 +27,10 @@ class WriteFileTool(Tool):
     schema = WriteFileParams
 
     async def execute(self, invocation: ToolInvocation) -> ToolResult:
+        # Writes block on the disk; keep them off the event loop
+        return await asyncio.to_thread(self._write, invocation)
+
+    def _write(self, invocation: ToolInvocation) -> ToolResult:
         params = WriteFileParams(**invocation.params)
         path = resolve_path(invocation.cwd, params.path)
 
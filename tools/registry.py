@@ -1,26 +1,49 @@
 from tools.base import Tool, ToolInvocation
+import asyncio
+import json
 import logging
+from collections import OrderedDict
+from dataclasses import replace
 from typing import Any
 from pathlib import Path
+from pydantic import BaseModel
 from tools.base import ToolResult
 from tools.builtin import get_all_builtin_tools
 logger = logging.getLogger(__name__)
 
+FileFingerprint = tuple[int, int, int]
+
 
 class ToolRegistry:
+    MAX_CACHED_RESULTS = 128
+
     def __init__(self):
         self._tools: dict[str, Tool] = {}
+        # OpenAI-format tool definitions, built once per registration rather
+        # than regenerating every pydantic schema on each turn
+        self._tool_payloads: dict[str, dict[str, Any]] = {}
+        self._payload: tuple[dict[str, Any], ...] | None = None
+        self._result_cache: OrderedDict[
+            tuple[Any, ...],
+            tuple[ToolResult, dict[Path, FileFingerprint]],
+        ] = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
 
     def register(self, tool: Tool) -> None:
         if tool.name in self._tools:
             logger.warning(f"Overwriting existing tool: {tool.name}")
 
         self._tools[tool.name] = tool
+        self._tool_payloads[tool.name] = tool.to_openai_tool()
+        self._payload = None
         logger.debug(f"Registered tool: {tool.name}")
 
     def unregister(self, name: str) -> bool:
-        if name in self.tools:
-            del self.tools[name]
+        if name in self._tools:
+            del self._tools[name]
+            del self._tool_payloads[name]
+            self._payload = None
             logger.debug(f"Unregistered tool: {name}")
             return True
         return False
@@ -39,11 +62,19 @@ class ToolRegistry:
 
         return tools
 
-    def get_schemas(self) -> list[dict[str, Any]]:
-        return [tool.to_openai_schema() for tool in self.get_tools()]
+    def get_schemas(self) -> tuple[dict[str, Any], ...]:
+        # The same object is returned until the registry changes, so callers
+        # must treat it as read-only
+        if self._payload is None:
+            self._payload = tuple(self._tool_payloads.values())
+        return self._payload
 
     async def invoke(
-        self, name: str, params: dict[str, Any], cwd: Path
+        self,
+        name: str,
+        params: dict[str, Any],
+        cwd: Path,
+        timeout: float | None = None,
     ) -> ToolResult:
         tool = self.get(name)
         if tool is None:
@@ -58,14 +89,109 @@ class ToolRegistry:
             )
 
         invocation = ToolInvocation(params=params, cwd=cwd)
+
+        cache_key = None
+        fingerprints: dict[Path, FileFingerprint] | None = None
+        if tool.cacheable and not tool.is_mutating(params):
+            cache_key, fingerprints = self._get_cache_entry_key(tool, invocation)
+            if cache_key is not None:
+                cached = self._get_cached_result(cache_key, fingerprints)
+                if cached is not None:
+                    return cached
+
+        timeout = timeout if timeout is not None else tool.timeout
+        deadline = asyncio.timeout(timeout)
         try:
-            return await tool.execute(invocation)
+            async with deadline:
+                result = await tool.execute(invocation)
         except Exception as e:
+            # Only our own deadline counts as a timeout; one raised inside
+            # the tool is an ordinary failure
+            if isinstance(e, TimeoutError) and deadline.expired():
+                logger.warning(f"Tool timed out after {timeout}s: {name}")
+                message = f"Tool timed out after {timeout:g} seconds"
+                if tool.is_mutating(params):
+                    # Built-in tools run in worker threads, which a deadline
+                    # abandons rather than stops
+                    message += "; its changes may still be applied"
+                return ToolResult.error_result(
+                    message,
+                    metadata={"tool_name": name, "timeout": timeout},
+                )
             logger.exception(f"Failed to execute tool: {name}")
             return ToolResult.error_result(
                 f"Internal Error: {str(e)}", metadata={"tool_name": name}
             )
-            
+
+        if cache_key is not None and result.success:
+            self._result_cache[cache_key] = (result, fingerprints)
+            while len(self._result_cache) > self.MAX_CACHED_RESULTS:
+                self._result_cache.popitem(last=False)
+        elif result.success and tool.is_mutating(params):
+            path = result.metadata.get("path")
+            if isinstance(path, str):
+                self.invalidate_path(Path(path))
+
+        return result
+
+    def _get_cache_entry_key(
+        self, tool: Tool, invocation: ToolInvocation
+    ) -> tuple[tuple[Any, ...] | None, dict[Path, FileFingerprint] | None]:
+        try:
+            paths = tool.get_cache_paths(invocation)
+            fingerprints = {path: _fingerprint(path) for path in paths}
+        except (OSError, KeyError, TypeError, ValueError):
+            return None, None
+
+        # Fill in defaults so {"path": "a"} and {"path": "a", "offset": 1}
+        # share an entry
+        params = invocation.params
+        schema = tool.schema
+        if isinstance(schema, type) and issubclass(schema, BaseModel):
+            params = schema(**params).model_dump()
+
+        key = (
+            tool.name,
+            json.dumps(params, sort_keys=True, default=str),
+            str(invocation.cwd),
+            tuple(str(path) for path in fingerprints),
+        )
+        return key, fingerprints
+
+    def _get_cached_result(
+        self,
+        key: tuple[Any, ...],
+        fingerprints: dict[Path, FileFingerprint],
+    ) -> ToolResult | None:
+        entry = self._result_cache.get(key)
+        if entry is None or entry[1] != fingerprints:
+            self.cache_misses += 1
+            return None
+
+        self._result_cache.move_to_end(key)
+        self.cache_hits += 1
+        result = entry[0]
+        return replace(result, metadata={**result.metadata, "cache_hit": True})
+
+    def invalidate_path(self, path: Path) -> None:
+        path = path.resolve()
+        stale = [
+            key
+            for key, (_, fingerprints) in self._result_cache.items()
+            if any(cached.resolve() == path for cached in fingerprints)
+        ]
+        for key in stale:
+            del self._result_cache[key]
+
+    def clear_cache(self) -> None:
+        self._result_cache.clear()
+
+
+def _fingerprint(path: Path) -> FileFingerprint:
+    stat = path.stat()
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
 def create_default_registry() -> ToolRegistry:
     registry = ToolRegistry()
     
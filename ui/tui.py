@@ -150,7 +150,7 @@ class TUI:
 
     def _extract_read_file_code(self, text: str) -> tuple[int, str] | None:
         body = text
-        header_match = re.match(r"^Showing lines (\d+)-(\d+) of (\d+)\n\n", text)
+        header_match = re.match(r"^Showing lines (\d+) to (\d+) of (\d+)\n\n", text)
         if header_match:
             body = text[header_match.end() :]
 
@@ -245,9 +245,13 @@ class TUI:
         if isinstance(metadata, dict) and isinstance(metadata.get("path"), str):
             primary_path = metadata.get("path"          )
             
-        if name == "read_file" and success:
+        read_file_code = None
+        if name == "read_file" and success and primary_path:
+            read_file_code = self._extract_read_file_code(output)
+
+        if read_file_code:
             if primary_path:
-                start_line, code = self._extract_read_file_code(output)
+                start_line, code = read_file_code
 
                 shown_start = metadata.get("shown_start")
                 shown_end = metadata.get("shown_end")
@@ -293,8 +297,9 @@ class TUI:
         else:
             output_display = truncate_text(
                 output,
-                "",
+                self.config.model_name,
                 self._max_block_tokens,
+                tail_tokens=self._max_block_tokens // 3,
             )
             blocks.append(
                 Syntax(
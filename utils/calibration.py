@@ -0,0 +1,76 @@
+import math
+import threading
+from dataclasses import dataclass
+from typing import Any, ClassVar
+
+
+@dataclass
+class TokenCalibration:
+    model: str
+    # Provider-reported prompt tokens per locally counted token
+    correction: float = 1.0
+    # Characters per local token, learned from exact counts
+    chars_per_token: float = 4.0
+    usage_samples: int = 0
+    char_samples: int = 0
+
+    SMOOTHING: ClassVar[float] = 0.2
+    MIN_CHAR_SAMPLES: ClassVar[int] = 8
+
+    @property
+    def is_calibrated(self) -> bool:
+        return self.char_samples >= self.MIN_CHAR_SAMPLES
+
+    def observe_text(self, chars: int, tokens: int) -> None:
+        if chars <= 0 or tokens <= 0:
+            return
+
+        ratio = chars / tokens
+        if self.char_samples == 0:
+            self.chars_per_token = ratio
+        else:
+            self.chars_per_token += self.SMOOTHING * (ratio - self.chars_per_token)
+        self.char_samples += 1
+
+    def observe_usage(self, local_tokens: int, provider_tokens: int) -> None:
+        if local_tokens <= 0 or provider_tokens <= 0:
+            return
+
+        ratio = provider_tokens / local_tokens
+        if self.usage_samples == 0:
+            self.correction = ratio
+        else:
+            self.correction += self.SMOOTHING * (ratio - self.correction)
+        self.usage_samples += 1
+
+    def estimate(self, text: str) -> int:
+        return max(1, math.ceil(len(text) / self.chars_per_token))
+
+    def to_provider_tokens(self, local_tokens: int) -> int:
+        return math.ceil(local_tokens * self.correction)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "model": self.model,
+            "correction": self.correction,
+            "chars_per_token": self.chars_per_token,
+            "usage_samples": self.usage_samples,
+            "char_samples": self.char_samples,
+        }
+
+
+_calibrations: dict[str, TokenCalibration] = {}
+_calibrations_lock = threading.Lock()
+
+
+def get_calibration(model: str) -> TokenCalibration:
+    calibration = _calibrations.get(model)
+    if calibration is not None:
+        return calibration
+
+    with _calibrations_lock:
+        calibration = _calibrations.get(model)
+        if calibration is None:
+            calibration = TokenCalibration(model=model)
+            _calibrations[model] = calibration
+        return calibration
@@ -1,25 +1,192 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from itertools import accumulate
+from typing import Any
 import tiktoken
+from utils.calibration import get_calibration
+
+DEFAULT_ENCODING = "cl100k_base"
+ESTIMATE_CACHE_KEY = "estimate"
+
+_encodings: dict[str, tiktoken.Encoding | None] = {}
+_encodings_lock = threading.Lock()
+
+
+def content_digest(text: str) -> bytes:
+    return hashlib.blake2b(
+        text.encode("utf-8", errors="surrogatepass"),
+        digest_size=16,
+    ).digest()
+
+
+class TokenCountCache:
+    MIN_CACHED_LENGTH = 256
+
+    def __init__(self, max_entries: int = 4096) -> None:
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple[str, bytes], int] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(cache_key: str, text: str) -> tuple[str, bytes]:
+        return cache_key, content_digest(text)
+
+    def get(self, key: tuple[str, bytes]) -> int | None:
+        with self._lock:
+            count = self._entries.get(key)
+            if count is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return count
+
+    def put(self, key: tuple[str, bytes], count: int) -> None:
+        with self._lock:
+            self._entries[key] = count
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_token_cache = TokenCountCache()
+
+
+def get_token_cache() -> TokenCountCache:
+    return _token_cache
+
+
+def _cache_key(text: str, encoding: tiktoken.Encoding | None) -> tuple[str, bytes] | None:
+    if len(text) < TokenCountCache.MIN_CACHED_LENGTH:
+        return None
+    # Keyed by encoding rather than model name, so models that share a
+    # tokenizer (and the tools, which don't know the model) share entries
+    name = encoding.name if encoding is not None else ESTIMATE_CACHE_KEY
+    return TokenCountCache.make_key(name, text)
+
+
+def get_encoding(model: str) -> tiktoken.Encoding | None:
+    encoding = _encodings.get(model)
+    if encoding is not None or model in _encodings:
+        return encoding
+
+    with _encodings_lock:
+        if model in _encodings:
+            return _encodings[model]
+
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except Exception:
+            try:
+                encoding = tiktoken.get_encoding(DEFAULT_ENCODING)
+            except Exception:
+                encoding = None
+
+        _encodings[model] = encoding
+        return encoding
 
 
 def get_tokenizer(model: str):
-    try:
-        encoding = tiktoken.encoding_for_model(model)
-        return encoding.encode
-    except Exception:
-        encoding = tiktoken.get_encoding("cl100k_base")
-        return encoding.encode
+    encoding = get_encoding(model)
+    if encoding is None:
+        return None
+
+    def tokenize(text: str) -> list[int]:
+        return encoding.encode(text, disallowed_special=())
+
+    return tokenize
 
 
 def count_tokens(text: str, model: str = "gpt-4") -> int:
-    tokenizer = get_tokenizer(model)
+    encoding = get_encoding(model)
+
+    key = _cache_key(text, encoding)
+    if key is not None:
+        cached = _token_cache.get(key)
+        if cached is not None:
+            return cached
+
+    if encoding is not None:
+        count = len(encoding.encode(text, disallowed_special=()))
+    else:
+        count = estimate_tokens(text)
+
+    if key is not None:
+        _token_cache.put(key, count)
+        if encoding is not None:
+            get_calibration(model).observe_text(len(text), count)
+    return count
+
+
+def count_tokens_batch(texts: list[str], model: str = "gpt-4") -> list[int]:
+    if not texts:
+        return []
+
+    encoding = get_encoding(model)
+    counts: list[int | None] = [None] * len(texts)
+    keys = [_cache_key(text, encoding) for text in texts]
+
+    missing: list[int] = []
+    for idx, key in enumerate(keys):
+        if key is not None:
+            counts[idx] = _token_cache.get(key)
+        if counts[idx] is None:
+            missing.append(idx)
+
+    if missing:
+        missing_texts = [texts[idx] for idx in missing]
+        if encoding is None:
+            missing_counts = [estimate_tokens(text) for text in missing_texts]
+        elif len(missing_texts) == 1:
+            missing_counts = [
+                len(encoding.encode(missing_texts[0], disallowed_special=()))
+            ]
+        else:
+            missing_counts = [
+                len(tokens)
+                for tokens in encoding.encode_batch(
+                    missing_texts, disallowed_special=()
+                )
+            ]
+
+        calibration = get_calibration(model)
+        for idx, count in zip(missing, missing_counts):
+            counts[idx] = count
+            if keys[idx] is not None:
+                _token_cache.put(keys[idx], count)
+                if encoding is not None:
+                    calibration.observe_text(len(texts[idx]), count)
 
-    if tokenizer:
-        return len(tokenizer(text))
+    return counts
 
-    return estimate_tokens(text)
 
+def estimate_tokens(text: str, model: str | None = None) -> int:
+    if model is not None:
+        calibration = get_calibration(model)
+        if calibration.is_calibrated:
+            return calibration.estimate(text)
 
-def estimate_tokens(text: str) -> int:
     return max(1, len(text) // 4)
 
 
@@ -29,51 +196,121 @@ def truncate_text(
     max_tokens: int,
     suffix: str = "\n... [truncated]",
     preserve_lines: bool = True,
+    tail_tokens: int = 0,
 ) -> str:
-    current_tokens = count_tokens(text, model)
-    if current_tokens <= max_tokens:
+    encoding = get_encoding(model)
+    if encoding is None:
+        return _truncate_estimated(
+            text, max_tokens, suffix, preserve_lines, tail_tokens
+        )
+
+    key = _cache_key(text, encoding)
+    if key is not None:
+        cached = _token_cache.get(key)
+        if cached is not None and cached <= max_tokens:
+            return text
+
+    # Every token covers at least one byte, so this is a hard bound; an
+    # estimate is not, and truncation enforces caps
+    if len(text.encode("utf-8", errors="surrogatepass")) <= max_tokens:
+        return text
+
+    calibration = get_calibration(model)
+
+    tokens = encoding.encode(text, disallowed_special=())
+    if key is not None:
+        _token_cache.put(key, len(tokens))
+        calibration.observe_text(len(text), len(tokens))
+    if len(tokens) <= max_tokens:
         return text
 
-    suffix_tokens = count_tokens(suffix, model)
+    # The separator between suffix and tail is part of the budget too
+    separator = "\n" if tail_tokens > 0 else ""
+    suffix_tokens = len(encoding.encode(suffix + separator, disallowed_special=()))
     target_tokens = max_tokens - suffix_tokens
 
     if target_tokens <= 0:
         return suffix.strip()
 
-    if preserve_lines:
-        return _truncate_by_lines(text, target_tokens, suffix, model)
-    else:
-        return _truncate_by_chars(text, target_tokens, suffix, model)
+    tail_tokens = max(0, min(tail_tokens, target_tokens))
+    head_tokens = target_tokens - tail_tokens
+
+    # Byte offset of every token boundary, so cuts never re-encode the text
+    token_bytes = encoding.decode_tokens_bytes(tokens)
+    offsets = list(accumulate((len(b) for b in token_bytes), initial=0))
+    data = b"".join(token_bytes)
+
+    while True:
+        head, tail = _cut(
+            data,
+            offsets[head_tokens],
+            offsets[len(tokens) - tail_tokens] if tail_tokens else len(data),
+            preserve_lines,
+            b"\n",
+        )
+        result = _join_truncated(
+            head.decode("utf-8", errors="ignore"),
+            tail.decode("utf-8", errors="ignore"),
+            suffix,
+        )
+        # Tokens can merge differently across the joins, so check the result
+        # and give up head tokens until it fits
+        overflow = len(encoding.encode(result, disallowed_special=())) - max_tokens
+        if overflow <= 0 or head_tokens == 0:
+            return result
+        head_tokens = max(0, head_tokens - overflow)
+
+
+def _truncate_estimated(
+    text: str,
+    max_tokens: int,
+    suffix: str,
+    preserve_lines: bool,
+    tail_tokens: int,
+) -> str:
+    if estimate_tokens(text) <= max_tokens:
+        return text
 
+    separator = "\n" if tail_tokens > 0 else ""
+    target_tokens = max_tokens - estimate_tokens(suffix + separator)
+    if target_tokens <= 0:
+        return suffix.strip()
 
-def _truncate_by_lines(text: str, target_tokens: int, suffix: str, model: str) -> str:
-    lines = text.split("\n")
-    result_lines: list[str] = []
-    current_tokens = 0
+    tail_tokens = max(0, min(tail_tokens, target_tokens))
+    head_chars = (target_tokens - tail_tokens) * 4
+    tail_chars = tail_tokens * 4
 
-    for line in lines:
-        line_tokens = count_tokens(line + "\n", model)
-        if current_tokens + line_tokens > target_tokens:
-            break
-        result_lines.append(line)
-        current_tokens += line_tokens
+    head, tail = _cut(
+        text,
+        head_chars,
+        len(text) - tail_chars if tail_chars else len(text),
+        preserve_lines,
+        "\n",
+    )
+    return _join_truncated(head, tail, suffix)
 
-    if not result_lines:
-        # Fall back to character truncation if no complete lines fit
-        return _truncate_by_chars(text, target_tokens, suffix, model)
 
-    return "\n".join(result_lines) + suffix
+def _cut(data, head_end: int, tail_start: int, preserve_lines: bool, newline):
+    if preserve_lines:
+        # Snap the head back to the end of its last complete line and the
+        # tail forward to the start of its first complete line. Fall back to
+        # the raw token boundary when no complete line fits.
+        if data[head_end : head_end + 1] != newline:
+            line_end = data.rfind(newline, 0, head_end)
+            if line_end >= 0:
+                head_end = line_end
 
+        if 0 < tail_start < len(data) and data[tail_start - 1 : tail_start] != newline:
+            line_start = data.find(newline, tail_start)
+            if line_start >= 0:
+                tail_start = line_start + 1
 
-def _truncate_by_chars(text: str, target_tokens: int, suffix: str, model: str) -> str:
-    # Binary search for the right length
-    low, high = 0, len(text)
+    head = data[:head_end]
+    tail = data[tail_start:] if tail_start < len(data) else data[:0]
+    return head, tail
 
-    while low < high:
-        mid = (low + high + 1) // 2
-        if count_tokens(text[:mid], model) <= target_tokens:
-            low = mid
-        else:
-            high = mid - 1
 
-    return text[:low] + suffix
+def _join_truncated(head: str, tail: str, suffix: str) -> str:
+    if not tail:
+        return head + suffix
+    return head + suffix + "\n" + tail